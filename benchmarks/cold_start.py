@@ -0,0 +1,164 @@
+"""
+Cold start benchmark for the skill's Lambda function.
+
+Every run starts a fresh interpreter, the way a new Lambda container would,
+and measures:
+
+- the cumulative import time of lambda_function, and the heaviest modules
+  imported under it (from `python -X importtime`)
+- the time to answer the first request, and a second one once warm, for a
+  few request types. DynamoDB and the Device Address API are replaced by the
+  stand-ins in stand_ins.py, so no AWS access is needed.
+
+Medians over --runs runs are reported.
+
+Usage:
+    python benchmarks/cold_start.py [--runs N] [--top N] [--json]
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+LAMBDA_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), 'lambda')
+
+# Event builders from envelopes.py used for the first-request measurement.
+EVENTS = {
+    'LaunchRequest': 'launch_request()',
+    'AMAZON.ResumeIntent': "intent_request('AMAZON.ResumeIntent')",
+    'AudioPlayer.PlaybackStarted': "audio_player_event('PlaybackStarted')",
+    'SessionEndedRequest': 'session_ended_request()',
+}
+
+FIRST_REQUEST_SCRIPT = """
+import json, sys, time
+t0 = time.perf_counter()
+import lambda_function
+t1 = time.perf_counter()
+sys.path.insert(0, {benchmarks_dir!r})
+import stand_ins
+from envelopes import *
+stand_ins.install(lambda_function)
+event = {event}
+t2 = time.perf_counter()
+lambda_function.lambda_handler(event, None)
+t3 = time.perf_counter()
+event = {event}
+t4 = time.perf_counter()
+lambda_function.lambda_handler(event, None)
+t5 = time.perf_counter()
+print(json.dumps({{'import': t1 - t0, 'first_request': t3 - t2, 'warm_request': t5 - t4}}))
+"""
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$')
+
+
+def _python(args, env=None):
+    process_env = dict(os.environ)
+    process_env.setdefault('METRICS_ENABLED', 'false')
+    process_env.update(env or {})
+    return subprocess.run(
+        [sys.executable] + args, cwd=LAMBDA_DIR, env=process_env,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+
+
+# Returns the cumulative import time (in seconds) of lambda_function and of
+# every module imported while importing it, keyed by module name. -X importtime
+# lists a module after the modules it imported, one level deeper indented.
+def measure_imports():
+    result = _python(['-X', 'importtime', '-c', 'import lambda_function'])
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        name, depth = match.group(4), len(match.group(3))
+        if depth == 1 and name != 'lambda_function':
+            # A top-level import of the interpreter itself (site, encodings, ...).
+            cumulative = {}
+            continue
+        # Keep the largest entry when a module shows up more than once.
+        cumulative[name] = max(cumulative.get(name, 0), int(match.group(2)) / 1e6)
+        if name == 'lambda_function':
+            break
+    return cumulative
+
+
+def measure_first_request(event):
+    script = FIRST_REQUEST_SCRIPT.format(benchmarks_dir=BENCHMARKS_DIR, event=event)
+    result = _python(['-c', script])
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def _median(values):
+    return statistics.median(values) if values else 0.0
+
+
+def run(runs, top):
+    import_runs = [measure_imports() for _ in range(runs)]
+    modules = set()
+    for cumulative in import_runs:
+        modules.update(cumulative)
+    module_medians = dict(
+        (module, _median([cumulative.get(module, 0.0) for cumulative in import_runs]))
+        for module in modules)
+    heaviest = sorted(
+        ((module, seconds) for module, seconds in module_medians.items() if module != 'lambda_function'),
+        key=lambda item: item[1], reverse=True)[:top]
+
+    first_requests = {}
+    for name, event in EVENTS.items():
+        samples = [measure_first_request(event) for _ in range(runs)]
+        first_requests[name] = dict(
+            (phase, _median([sample[phase] for sample in samples]))
+            for phase in ('import', 'first_request', 'warm_request'))
+
+    return {
+        'runs': runs,
+        'python': sys.version.split()[0],
+        'import_lambda_function': module_medians.get('lambda_function', 0.0),
+        'heaviest_imports': heaviest,
+        'first_request': first_requests,
+    }
+
+
+def _ms(seconds):
+    return '{:9.2f} ms'.format(seconds * 1000)
+
+
+def print_report(report):
+    print('Cold start, median of {} runs (Python {})'.format(report['runs'], report['python']))
+    print('')
+    print('import lambda_function   {}'.format(_ms(report['import_lambda_function'])))
+    print('')
+    print('Heaviest imports (cumulative)')
+    for module, seconds in report['heaviest_imports']:
+        print('  {:<48} {}'.format(module, _ms(seconds)))
+    print('')
+    print('{:<30} {:>12} {:>13} {:>13}'.format('First request', 'import', 'first', 'warm'))
+    for name, phases in report['first_request'].items():
+        print('  {:<28} {} {} {}'.format(
+            name, _ms(phases['import']), _ms(phases['first_request']), _ms(phases['warm_request'])))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='fresh processes per measurement')
+    parser.add_argument('--top', type=int, default=15, help='number of heaviest imports to list')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args(argv)
+
+    report = run(args.runs, args.top)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == '__main__':
+    main()
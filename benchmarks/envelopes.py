@@ -0,0 +1,79 @@
+"""
+Builders for Alexa request envelopes, shaped like the JSON events the
+Alexa service sends to the skill's Lambda function.
+"""
+
+import uuid
+
+SKILL_ID = 'amzn1.ask.skill.00000000-0000-0000-0000-000000000000'
+API_ENDPOINT = 'https://api.amazonalexa.com'
+
+
+def _system(user_id, device_id, consent, audio_player):
+    user = {'userId': user_id}
+    if consent:
+        user['permissions'] = {'consentToken': 'consent-token'}
+    supported_interfaces = {'AudioPlayer': {}} if audio_player else {}
+    return {
+        'application': {'applicationId': SKILL_ID},
+        'user': user,
+        'device': {'deviceId': device_id, 'supportedInterfaces': supported_interfaces},
+        'apiEndpoint': API_ENDPOINT,
+        'apiAccessToken': 'api-access-token',
+    }
+
+
+def envelope(request, user_id='amzn1.ask.account.benchmark', device_id='amzn1.ask.device.benchmark',
+             locale='en-US', session=True, session_attributes=None, consent=True, audio_player=True):
+    request = dict(request)
+    request.setdefault('requestId', 'amzn1.echo-api.request.' + uuid.uuid4().hex)
+    request.setdefault('timestamp', '2020-10-17T10:00:00Z')
+    request.setdefault('locale', locale)
+    event = {
+        'version': '1.0',
+        'context': {
+            'System': _system(user_id, device_id, consent, audio_player),
+            'AudioPlayer': {'playerActivity': 'IDLE'},
+        },
+        'request': request,
+    }
+    if session:
+        event['session'] = {
+            'new': True,
+            'sessionId': 'amzn1.echo-api.session.' + uuid.uuid4().hex,
+            'application': {'applicationId': SKILL_ID},
+            'user': {'userId': user_id},
+            'attributes': session_attributes,
+        }
+    return event
+
+
+def launch_request(**kwargs):
+    return envelope({'type': 'LaunchRequest'}, **kwargs)
+
+
+def intent_request(intent_name, slots=None, **kwargs):
+    intent = {'name': intent_name, 'confirmationStatus': 'NONE'}
+    if slots:
+        intent['slots'] = dict(
+            (name, {'name': name, 'value': value, 'confirmationStatus': 'NONE'})
+            for name, value in slots.items())
+    return envelope({'type': 'IntentRequest', 'intent': intent, 'dialogState': 'COMPLETED'}, **kwargs)
+
+
+def audio_player_event(event_type, token='token', offset_in_milliseconds=0, error=None, **kwargs):
+    request = {'type': 'AudioPlayer.' + event_type, 'token': token, 'offsetInMilliseconds': offset_in_milliseconds}
+    if error is not None:
+        request['error'] = error
+        request['currentPlaybackState'] = {'token': token, 'offsetInMilliseconds': offset_in_milliseconds, 'playerActivity': 'STOPPED'}
+    kwargs.setdefault('session', False)
+    return envelope(request, **kwargs)
+
+
+def playback_controller_event(command, **kwargs):
+    kwargs.setdefault('session', False)
+    return envelope({'type': 'PlaybackController.' + command}, **kwargs)
+
+
+def session_ended_request(reason='USER_INITIATED', **kwargs):
+    return envelope({'type': 'SessionEndedRequest', 'reason': reason}, **kwargs)
@@ -0,0 +1,160 @@
+"""
+Offline checks of stream health probes and playback failover (lambda/stream_health.py).
+
+Local HTTP servers (see local_servers.py) stand in for the stream hosts: an
+endless 200 stream, a 503, a SHOUTcast "ICY 200 OK" server and a closed
+port. The checks cover:
+
+- probe_stream on each of them, reading only the headers of the stream
+- fail_over picking the next mirror that is up, falling back to the
+  default stream once every mirror of a stream is down, replaying the
+  stream when the fallback is down too, and giving up after
+  STREAM_FAILOVER_MAX_ATTEMPTS failovers
+- a PlaybackFailed event answered by lambda_function (DynamoDB and the
+  Device Address API replaced by the stand-ins in stand_ins.py) for a
+  stream without mirrors, which plays the default stream
+
+Fails (exit status 1) when any check does.
+
+Usage:
+    python benchmarks/failover_check.py [--json]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+LAMBDA_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), 'lambda')
+
+os.environ.setdefault('METRICS_ENABLED', 'false')
+sys.path.insert(0, LAMBDA_DIR)
+
+from local_servers import (LocalServer, icy, media, status)  # noqa: E402
+from stream_health import (STREAM_FAILOVER_MAX_ATTEMPTS, StreamHealthCache, StreamProber,  # noqa: E402
+                           fail_over, probe_stream)
+
+# Probing must only read the headers of the endless stream.
+MAX_PROBE_SECONDS = 1.0
+
+ROUTES = {
+    '/live': media,
+    '/mirror': media,
+    '/unavailable': status(503),
+    '/overloaded': status(503),
+    '/icy': icy,
+}
+
+
+def _closed_port_url():
+    # A server that was stopped leaves its port closed.
+    server = LocalServer({})
+    url = server.url('/live')
+    server.stop()
+    return url
+
+
+def _fail_over(*args, **kwargs):
+    health = StreamHealthCache()
+    return fail_over(*args, health=health, prober=StreamProber(health), **kwargs)
+
+
+# Answers a PlaybackFailed for token with lambda_function, its stream_db.json
+# replaced by stream_db. Returns the token and URL of the directive played, if any.
+def _playback_failed(stream_db, token):
+    import envelopes
+    import lambda_function
+    import stand_ins
+    from stream_catalog import stream_catalog
+
+    stand_ins.install(lambda_function)
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as stream_db_file:
+        json.dump(stream_db, stream_db_file)
+    try:
+        stream_catalog.path = stream_db_file.name
+        stream_catalog.preload()
+        event = envelopes.audio_player_event(
+            'PlaybackFailed', token=token, error={'type': 'MEDIA_ERROR_SERVICE_UNAVAILABLE', 'message': 'Offline'})
+        directives = lambda_function.lambda_handler(event, None)['response'].get('directives') or []
+    finally:
+        os.unlink(stream_db_file.name)
+    if not directives:
+        return None
+    stream = directives[0]['audioItem']['stream']
+    return stream['token'], stream['url']
+
+
+def run():
+    checks = []
+
+    def check(name, passed, detail=None):
+        checks.append({'check': name, 'passed': bool(passed), 'detail': detail})
+
+    with LocalServer(ROUTES) as server:
+        live, mirror = server.url('/live'), server.url('/mirror')
+        unavailable, overloaded = server.url('/unavailable'), server.url('/overloaded')
+        closed = _closed_port_url()
+
+        started = time.time()
+        healthy = probe_stream(live)
+        elapsed = time.time() - started
+        check('a 200 stream is healthy', healthy)
+        check('probing reads only the headers of the stream', elapsed < MAX_PROBE_SECONDS, '{:.3f}s'.format(elapsed))
+        check('a 503 is unhealthy', not probe_stream(unavailable))
+        check('an ICY 200 server is healthy', probe_stream(server.url('/icy')))
+        check('a closed port is unhealthy', not probe_stream(closed))
+
+        result = _fail_over('SG', (unavailable, overloaded, mirror), 0, 0)
+        check('fails over to the first mirror that is up', result == ('SG', 2, 1), result)
+
+        result = _fail_over('SG', (unavailable, mirror), 0, 0, fallback_key='default', fallback_urls=(live,))
+        check("a mirror that is up is preferred to the fallback", result == ('SG', 1, 1), result)
+
+        result = _fail_over('SG', (unavailable,), 0, 0, fallback_key='default', fallback_urls=(live,))
+        check('a stream without mirrors falls back to the default stream', result == ('default', 0, 1), result)
+
+        result = _fail_over('SG', (unavailable, closed), 0, 1, fallback_key='default', fallback_urls=(overloaded, live))
+        check('falls back once every mirror is down, to a fallback mirror that is up',
+              result == ('default', 1, 2), result)
+
+        result = _fail_over('SG', (unavailable,), 0, 0, fallback_key='default', fallback_urls=(overloaded,))
+        check('replays the stream when the fallback is down too', result == ('SG', 0, 1), result)
+
+        result = _fail_over('SG', (unavailable, mirror), 0, STREAM_FAILOVER_MAX_ATTEMPTS)
+        check('gives up after STREAM_FAILOVER_MAX_ATTEMPTS failovers', result is None, result)
+
+        result = _fail_over('SG', (unavailable, mirror), 0, STREAM_FAILOVER_MAX_ATTEMPTS, played_ms=120000)
+        check('a long playback starts the count over', result == ('SG', 1, 1), result)
+
+        with open(os.path.join(LAMBDA_DIR, 'stream_db.json')) as stream_db_file:
+            stream_db = json.load(stream_db_file)
+        stream_key = sorted(key for key in stream_db if key != 'default')[0]
+        stream_db[stream_key] = dict(stream_db[stream_key], stream_url=unavailable, mirrors=[])
+        stream_db['default'] = dict(stream_db['default'], stream_url=live, mirrors=[])
+        played = _playback_failed(stream_db, '{}:0:0'.format(stream_key))
+        check('PlaybackFailed of a stream without mirrors plays the default stream',
+              played == ('default:0:1', live), played)
+
+    return checks
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args(argv)
+
+    checks = run()
+    if args.json:
+        print(json.dumps(checks, indent=2))
+    else:
+        for result in checks:
+            detail = ' ({})'.format(result['detail']) if result['detail'] is not None else ''
+            print('{} {}{}'.format('ok  ' if result['passed'] else 'FAIL', result['check'], detail))
+    return 0 if all(result['passed'] for result in checks) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
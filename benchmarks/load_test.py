@@ -0,0 +1,316 @@
+"""
+Offline load test for the skill's Lambda function.
+
+Generates a weighted mix of request envelopes, replays them through
+lambda_function.lambda_handler in a single process (one warm container) and
+reports throughput and p50/p95/p99 latency per scenario and per handler.
+DynamoDB and the Device Address API are replaced by the stand-ins in
+stand_ins.py, with configurable injected latency.
+
+The mean latency of the mix also gives a rough provisioned concurrency
+estimate for a given peak request rate (Little's law: rate x latency).
+
+Usage:
+    python benchmarks/load_test.py [--mix default|launch|playback]
+        [--weights scenario=weight,...] [--requests N] [--warmup N]
+        [--dynamodb-read-latency MS] [--dynamodb-write-latency MS]
+        [--address-latency MS] [--peak-rps RPS] [--seed N] [--json] [--verbose]
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import sys
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+LAMBDA_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), 'lambda')
+
+# EMF metric lines would be interleaved with the report.
+os.environ.setdefault('METRICS_ENABLED', 'false')
+sys.path.insert(0, LAMBDA_DIR)
+
+import envelopes
+import stand_ins
+
+from directives import stream_token
+
+# Countries with a stream of their own in stream_db.json, plus one without.
+COUNTRY_CODES = ('SG', 'ID', 'HK', 'US')
+RETURNING_USERS = 500
+
+MIXES = {
+    # Roughly what a radio skill sees in production: mostly playback events.
+    'default': {
+        'PlaybackStarted': 25,
+        'PlaybackStopped': 20,
+        'PlaybackNearlyFinished': 2,
+        'PlaybackFailed': 1,
+        'LaunchRequest (returning user)': 15,
+        'LaunchRequest (new user)': 3,
+        'LaunchRequest (country stream offer)': 2,
+        'AMAZON.YesIntent': 2,
+        'AMAZON.NoIntent': 1,
+        'AMAZON.PauseIntent': 5,
+        'PauseCommandIssued': 3,
+        'AMAZON.ResumeIntent': 5,
+        'PlayCommandIssued': 3,
+        'SessionEndedRequest': 8,
+    },
+    'launch': {
+        'LaunchRequest (returning user)': 6,
+        'LaunchRequest (new user)': 3,
+        'LaunchRequest (country stream offer)': 1,
+    },
+    'playback': {
+        'PlaybackStarted': 10,
+        'PlaybackStopped': 8,
+        'PlaybackNearlyFinished': 1,
+        'PlaybackFailed': 1,
+    },
+}
+
+
+def _user_id(index):
+    return 'amzn1.ask.account.user{:06d}'.format(index)
+
+
+def _device_id(index):
+    return 'amzn1.ask.device.device{:06d}'.format(index)
+
+
+# Builds the envelopes of every scenario for a pool of returning users, whose
+# persisted items are seeded into the stand-in adapter, and an endless
+# supply of new users.
+class EnvelopeFactory(object):
+
+    def __init__(self, rng, persistence_adapter, returning_users=RETURNING_USERS):
+        self.rng = rng
+        self.returning_users = returning_users
+        self.country_codes = {}
+        self.stream_keys = []
+        self._new_users = itertools.count(returning_users)
+        for index in range(returning_users):
+            country_code = COUNTRY_CODES[index % len(COUNTRY_CODES)]
+            self.country_codes[_device_id(index)] = country_code
+            stream_key = country_code if country_code in ('SG', 'ID', 'HK') else 'default'
+            self.stream_keys.append(stream_key)
+            # A returning user already has the country of their device persisted.
+            persistence_adapter.items[_user_id(index)] = {
+                'stream': {'version': 1, 'key': stream_key},
+                'device_country': {_device_id(index): {'country_code': country_code, 'fetched_at': int(time.time())}},
+            }
+        # Users who were on the default stream before their country got one.
+        self.offer_users = [
+            index for index in range(returning_users) if COUNTRY_CODES[index % len(COUNTRY_CODES)] == 'SG']
+        self.scenarios = {
+            'PlaybackStarted': lambda: envelopes.audio_player_event('PlaybackStarted', **self._playing()),
+            'PlaybackStopped': lambda: envelopes.audio_player_event(
+                'PlaybackStopped', offset_in_milliseconds=self.rng.randint(0, 3600000), **self._playing()),
+            'PlaybackNearlyFinished': lambda: envelopes.audio_player_event('PlaybackNearlyFinished', **self._playing()),
+            'PlaybackFailed': lambda: envelopes.audio_player_event(
+                'PlaybackFailed', error={'type': 'MEDIA_ERROR_SERVICE_UNAVAILABLE', 'message': 'unavailable'},
+                offset_in_milliseconds=self.rng.randint(0, 3600000), **self._playing()),
+            'LaunchRequest (returning user)': lambda: envelopes.launch_request(**self._returning()),
+            'LaunchRequest (new user)': lambda: envelopes.launch_request(**self._new()),
+            'LaunchRequest (country stream offer)': lambda: envelopes.launch_request(**self._offer()),
+            'AMAZON.YesIntent': lambda: envelopes.intent_request(
+                'AMAZON.YesIntent', session_attributes={'stream_key': 'SG'}, **self._offer()),
+            'AMAZON.NoIntent': lambda: envelopes.intent_request(
+                'AMAZON.NoIntent', session_attributes={'stream_key': 'SG'}, **self._offer()),
+            'AMAZON.PauseIntent': lambda: envelopes.intent_request('AMAZON.PauseIntent', **self._returning()),
+            'PauseCommandIssued': lambda: envelopes.playback_controller_event('PauseCommandIssued', **self._returning()),
+            'AMAZON.ResumeIntent': lambda: envelopes.intent_request('AMAZON.ResumeIntent', **self._returning()),
+            'PlayCommandIssued': lambda: envelopes.playback_controller_event('PlayCommandIssued', **self._returning()),
+            'SessionEndedRequest': lambda: envelopes.session_ended_request(**self._returning()),
+        }
+
+    def _user(self, index):
+        return {'user_id': _user_id(index), 'device_id': _device_id(index)}
+
+    def _returning(self):
+        return self._user(self.rng.randrange(self.returning_users))
+
+    # A returning user's AudioPlayer event, carrying the token of their stream's directive.
+    def _playing(self):
+        index = self.rng.randrange(self.returning_users)
+        stream_key = self.stream_keys[index]
+        return dict(self._user(index), token=stream_token(stream_key))
+
+    def _new(self):
+        index = next(self._new_users)
+        self.country_codes[_device_id(index)] = self.rng.choice(COUNTRY_CODES)
+        return self._user(index)
+
+    def _offer(self):
+        index = self.rng.choice(self.offer_users)
+        return self._user(index)
+
+    def build(self, scenario):
+        return self.scenarios[scenario]()
+
+
+# Name of the handler the skill dispatches the event to, without invoking it.
+def handler_name(skill_builder, event):
+    from fast_path import route_of_event
+
+    chain = skill_builder.request_mapper.route_table.get(route_of_event(event))
+    if chain is None:
+        return 'CatchAllExceptionHandler'
+    return type(chain.request_handler).__name__
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = max(0, int(math.ceil(pct / 100.0 * len(sorted_values))) - 1)
+    return sorted_values[index]
+
+
+def summarize(latencies, wall_time=None):
+    values = sorted(latencies)
+    summary = {
+        'count': len(values),
+        'mean': sum(values) / len(values) if values else 0.0,
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+        'max': values[-1] if values else 0.0,
+    }
+    if wall_time is not None:
+        summary['throughput'] = len(values) / wall_time if wall_time else 0.0
+    return summary
+
+
+def parse_weights(mix, overrides):
+    weights = dict(MIXES[mix])
+    for item in filter(None, (overrides or '').split(',')):
+        scenario, _, weight = item.rpartition('=')
+        weights[scenario.strip()] = float(weight)
+    return dict((scenario, weight) for scenario, weight in weights.items() if weight > 0)
+
+
+def run(weights, requests, warmup, read_latency, write_latency, address_latency, seed):
+    import lambda_function
+
+    rng = random.Random(seed)
+    persistence_adapter = stand_ins.InMemoryPersistenceAdapter(read_latency=read_latency, write_latency=write_latency)
+    factory = EnvelopeFactory(rng, persistence_adapter)
+    unknown = set(weights) - set(factory.scenarios)
+    if unknown:
+        raise SystemExit('Unknown scenarios: {}'.format(', '.join(sorted(unknown))))
+    api_client = stand_ins.StubDeviceAddressApiClient(latency=address_latency, country_codes=factory.country_codes)
+    stand_ins.install(lambda_function, persistence_adapter=persistence_adapter, api_client=api_client)
+    lambda_handler = lambda_function.lambda_handler
+
+    scenarios = list(weights)
+    plan = rng.choices(scenarios, weights=[weights[scenario] for scenario in scenarios], k=warmup + requests)
+    events = [(scenario, factory.build(scenario)) for scenario in plan]
+    handlers = dict(
+        (scenario, handler_name(lambda_function.sb, event)) for scenario, event in events)
+
+    latencies = []
+    perf_counter = time.perf_counter
+    for scenario, event in events[:warmup]:
+        lambda_handler(event, None)
+    started = perf_counter()
+    for scenario, event in events[warmup:]:
+        request_started = perf_counter()
+        lambda_handler(event, None)
+        latencies.append((scenario, perf_counter() - request_started))
+    wall_time = perf_counter() - started
+
+    by_scenario = {}
+    by_handler = {}
+    for scenario, latency in latencies:
+        by_scenario.setdefault(scenario, []).append(latency)
+        by_handler.setdefault(handlers[scenario], []).append(latency)
+
+    return {
+        'requests': requests,
+        'warmup': warmup,
+        'seed': seed,
+        'injected_latency': {
+            'dynamodb_read': read_latency, 'dynamodb_write': write_latency, 'address_api': address_latency},
+        'wall_time': wall_time,
+        'total': summarize([latency for _, latency in latencies], wall_time),
+        'scenarios': dict(
+            (scenario, dict(summarize(values), handler=handlers[scenario])) for scenario, values in by_scenario.items()),
+        'handlers': dict((handler, summarize(values)) for handler, values in by_handler.items()),
+        'dynamodb_reads': persistence_adapter.reads,
+        'dynamodb_writes': persistence_adapter.writes,
+        'address_api_calls': api_client.calls,
+    }
+
+
+def _ms(seconds):
+    return '{:9.3f}'.format(seconds * 1000)
+
+
+def _print_table(title, rows, extra_column=None):
+    header = '{:<38} {:>7} {:>9} {:>9} {:>9} {:>9}'.format(title, 'count', 'p50 ms', 'p95 ms', 'p99 ms', 'max ms')
+    if extra_column:
+        header += '  ' + extra_column
+    print(header)
+    for name, summary in sorted(rows.items(), key=lambda item: -item[1]['count']):
+        line = '  {:<36} {:>7} {} {} {} {}'.format(
+            name, summary['count'], _ms(summary['p50']), _ms(summary['p95']), _ms(summary['p99']), _ms(summary['max']))
+        if extra_column:
+            line += '  ' + summary['handler']
+        print(line)
+    print('')
+
+
+def print_report(report, peak_rps=None):
+    total = report['total']
+    latency = report['injected_latency']
+    print('{} requests after {} warm-up requests, seed {}'.format(report['requests'], report['warmup'], report['seed']))
+    print('Injected latency: DynamoDB read {:.1f} ms, write {:.1f} ms, Device Address API {:.1f} ms'.format(
+        latency['dynamodb_read'] * 1000, latency['dynamodb_write'] * 1000, latency['address_api'] * 1000))
+    print('DynamoDB reads {}, writes {}, Device Address API calls {}'.format(
+        report['dynamodb_reads'], report['dynamodb_writes'], report['address_api_calls']))
+    print('')
+    print('Throughput {:.1f} requests/s per container, mean {} ms, p50 {} ms, p95 {} ms, p99 {} ms'.format(
+        total['throughput'], _ms(total['mean']).strip(), _ms(total['p50']).strip(),
+        _ms(total['p95']).strip(), _ms(total['p99']).strip()))
+    if peak_rps:
+        print('Provisioned concurrency estimate for {:.0f} requests/s: {} (mean), {} (p99)'.format(
+            peak_rps, int(math.ceil(peak_rps * total['mean'])), int(math.ceil(peak_rps * total['p99']))))
+    print('')
+    _print_table('Scenario', report['scenarios'], extra_column='handler')
+    _print_table('Handler', report['handlers'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--mix', choices=sorted(MIXES), default='default', help='request mix to replay')
+    parser.add_argument('--weights', help='comma separated scenario=weight overrides of the mix')
+    parser.add_argument('--requests', type=int, default=5000, help='number of measured requests')
+    parser.add_argument('--warmup', type=int, default=500, help='requests replayed before measuring')
+    parser.add_argument('--dynamodb-read-latency', type=float, default=0.0, metavar='MS')
+    parser.add_argument('--dynamodb-write-latency', type=float, default=0.0, metavar='MS')
+    parser.add_argument('--address-latency', type=float, default=0.0, metavar='MS', help='Device Address API latency')
+    parser.add_argument('--peak-rps', type=float, help='peak request rate to size provisioned concurrency for')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    parser.add_argument('--verbose', action='store_true', help='print the skill\'s log output')
+    args = parser.parse_args(argv)
+
+    # The skill's log records are still formatted, as they would be in Lambda, but discarded unless asked for.
+    logging.basicConfig(stream=sys.stderr if args.verbose else open(os.devnull, 'w'), level=logging.INFO)
+    report = run(
+        parse_weights(args.mix, args.weights), args.requests, args.warmup,
+        args.dynamodb_read_latency / 1000.0, args.dynamodb_write_latency / 1000.0,
+        args.address_latency / 1000.0, args.seed)
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    else:
+        print_report(report, args.peak_rps)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Local HTTP servers standing in for radio stream hosts, so stream URL
+resolution, health checks and failover can be exercised offline.
+"""
+
+import threading
+import time
+
+from http.server import (BaseHTTPRequestHandler, HTTPServer)
+from socketserver import ThreadingMixIn
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+# An endless audio stream: the response body never ends, only its headers
+# should ever be read.
+def media(request, content_type='audio/mpeg', chunk=b'\0' * 1024, interval=0.01):
+    request.send_response(200)
+    request.send_header('Content-Type', content_type)
+    request.end_headers()
+    try:
+        while True:
+            request.wfile.write(chunk)
+            time.sleep(interval)
+    except (IOError, OSError):
+        pass
+
+
+def playlist(body, content_type):
+    def respond(request):
+        payload = body.format(base=request.server.base_url).encode('utf-8')
+        request.send_response(200)
+        request.send_header('Content-Type', content_type)
+        request.send_header('Content-Length', str(len(payload)))
+        request.end_headers()
+        request.wfile.write(payload)
+    return respond
+
+
+def redirect(path, status=302):
+    def respond(request):
+        request.send_response(status)
+        request.send_header('Location', request.server.base_url + path)
+        request.end_headers()
+    return respond
+
+
+def status(code):
+    def respond(request):
+        request.send_response(code)
+        request.send_header('Content-Length', '0')
+        request.end_headers()
+    return respond
+
+
+# A SHOUTcast v1 server, answering "ICY 200 OK" instead of an HTTP status line.
+def icy(request, chunk=b'\0' * 1024):
+    try:
+        request.wfile.write(b'ICY 200 OK\r\nicy-name: Local\r\ncontent-type: audio/mpeg\r\n\r\n')
+        request.wfile.write(chunk)
+        request.wfile.flush()
+    except (IOError, OSError):
+        pass
+
+
+class _RouteHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        respond = self.server.routes.get(self.path.split('?', 1)[0])
+        if respond is None:
+            status(404)(self)
+        else:
+            respond(self)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Serves routes ({path: respond(request)}, see the builders above) on a free
+# local port from a background thread, until stop() is called. Playlist
+# bodies may refer to the server as {base}.
+class LocalServer(object):
+
+    def __init__(self, routes, handler_class=_RouteHandler):
+        self._server = _ThreadingHTTPServer(('127.0.0.1', 0), handler_class)
+        self._server.routes = routes
+        self._server.requests = []
+        self._server.base_url = 'http://127.0.0.1:{}'.format(self._server.server_port)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    @property
+    def base_url(self):
+        return self._server.base_url
+
+    @property
+    def requests(self):
+        return self._server.requests
+
+    def url(self, path):
+        return self.base_url + path
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        return False
@@ -0,0 +1,188 @@
+"""
+Memory footprint of the skill's Lambda function, checked against a budget.
+
+Every run starts a fresh interpreter, the way a new Lambda container would,
+and measures the memory used after each of these phases:
+
+- import: importing lambda_function
+- assets: loading the stream catalog, the language prompts and the station index
+- clients: creating the boto3 and Alexa API clients (without connecting)
+- requests: answering a few requests of different types, which loads the
+  SDK models they are deserialized into and serialized from. DynamoDB and
+  the Device Address API are replaced by the stand-ins in stand_ins.py, so
+  no AWS access is needed.
+
+The resident set size (RSS) is measured in an untraced process, as tracing
+itself takes memory. A second process traces the allocations with
+tracemalloc and reports the Python memory in use and the allocation sites
+holding the most of it, by package (or module of the function).
+
+Fails (exit status 1) when the peak RSS or the peak traced memory exceeds
+its budget, e.g. in CI after a catalog or prompt change, before lowering
+the memory setting of the function.
+
+Usage:
+    python benchmarks/memory_budget.py [--rss-budget-mb MB] [--traced-budget-mb MB] [--top N] [--json]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+LAMBDA_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), 'lambda')
+
+# Budgets in MiB. The peak RSS of the process is what counts towards the
+# memory setting of the function, the traced peak is the Python heap only.
+RSS_BUDGET_MB = float(os.environ.get('MEMORY_BUDGET_RSS_MB', '80'))
+TRACED_BUDGET_MB = float(os.environ.get('MEMORY_BUDGET_TRACED_MB', '48'))
+
+# Event builders from envelopes.py answered in the requests phase.
+EVENTS = [
+    'launch_request()',
+    "intent_request('AMAZON.ResumeIntent')",
+    "intent_request('PlayStationIntent', slots={'station': 'radio singapore'})",
+    "audio_player_event('PlaybackStarted')",
+    "audio_player_event('PlaybackStopped')",
+    'session_ended_request()',
+]
+
+FOOTPRINT_SCRIPT = """
+import json, sys, tracemalloc
+trace = {trace!r}
+if trace:
+    tracemalloc.start({frames})
+from memory_profiling import (current_rss_bytes, peak_rss_bytes, top_allocation_sites)
+phases = []
+def measure(phase):
+    traced, traced_peak = tracemalloc.get_traced_memory() if trace else (None, None)
+    phases.append({{'phase': phase, 'rss': current_rss_bytes(), 'max_rss': peak_rss_bytes(),
+                   'traced': traced, 'traced_peak': traced_peak}})
+measure('start')
+import lambda_function
+measure('import')
+lambda_function.stream_catalog.preload()
+lambda_function.language_prompts_catalog.preload()
+lambda_function.station_directory.preload()
+measure('assets')
+for name in lambda_function.client_registry.names():
+    lambda_function.client_registry.get(name)
+measure('clients')
+sys.path.insert(0, {benchmarks_dir!r})
+import stand_ins
+from envelopes import *
+stand_ins.install(lambda_function)
+for event in [{events}]:
+    lambda_function.lambda_handler(event, None)
+measure('requests')
+sites = []
+if trace:
+    sites = top_allocation_sites(tracemalloc.take_snapshot(), limit={top}, by_package=True)
+print(json.dumps({{'phases': phases, 'sites': sites}}))
+"""
+
+def _python(args, env=None):
+    process_env = dict(os.environ)
+    process_env.setdefault('METRICS_ENABLED', 'false')
+    process_env.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    # Nothing is connected to, the clients are only created.
+    process_env.setdefault('WARM_UP_CLIENTS', '')
+    process_env.update(env or {})
+    return subprocess.run(
+        [sys.executable] + args, cwd=LAMBDA_DIR, env=process_env,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+
+
+# Allocations are grouped by the package (or module of the function) that
+# made them, see memory_profiling.allocation_package.
+def measure_footprint(trace, top=15, frames=25):
+    script = FOOTPRINT_SCRIPT.format(
+        trace=trace, top=top, frames=frames, benchmarks_dir=BENCHMARKS_DIR, events=', '.join(EVENTS))
+    # Profiling is measured here, the function's own profiler stays off.
+    result = _python(['-c', script], env={'MEMORY_PROFILING': 'false'})
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def _mib(size):
+    return size / (1024.0 * 1024.0) if size is not None else None
+
+
+def run(top):
+    untraced = measure_footprint(trace=False)
+    traced = measure_footprint(trace=True, top=top)
+    traced_phases = dict((phase['phase'], phase) for phase in traced['phases'])
+    phases = []
+    for phase in untraced['phases']:
+        phases.append({
+            'phase': phase['phase'],
+            'rss_mb': _mib(phase['rss']),
+            'max_rss_mb': _mib(phase['max_rss']),
+            'traced_mb': _mib(traced_phases[phase['phase']]['traced']),
+            'traced_peak_mb': _mib(traced_phases[phase['phase']]['traced_peak']),
+        })
+    return {
+        'python': sys.version.split()[0],
+        'phases': phases,
+        'max_rss_mb': phases[-1]['max_rss_mb'],
+        'traced_peak_mb': phases[-1]['traced_peak_mb'],
+        'top_allocation_sites': [
+            {'site': site, 'size_mb': _mib(size), 'blocks': count} for site, size, count in traced['sites']],
+    }
+
+
+# Returns a message for every budget the report exceeds.
+def check_budget(report, rss_budget_mb, traced_budget_mb):
+    exceeded = []
+    if report['max_rss_mb'] > rss_budget_mb:
+        exceeded.append('peak RSS {:.1f} MiB exceeds the budget of {:.1f} MiB'.format(
+            report['max_rss_mb'], rss_budget_mb))
+    if report['traced_peak_mb'] > traced_budget_mb:
+        exceeded.append('peak traced memory {:.1f} MiB exceeds the budget of {:.1f} MiB'.format(
+            report['traced_peak_mb'], traced_budget_mb))
+    return exceeded
+
+
+def _mb(size):
+    return '{:9.2f} MiB'.format(size) if size is not None else '{:>13}'.format('-')
+
+
+def print_report(report, rss_budget_mb, traced_budget_mb):
+    print('Memory footprint (Python {})'.format(report['python']))
+    print('')
+    print('{:<12} {:>13} {:>13} {:>13} {:>13}'.format('After', 'RSS', 'peak RSS', 'traced', 'traced peak'))
+    for phase in report['phases']:
+        print('  {:<10} {} {} {} {}'.format(
+            phase['phase'], _mb(phase['rss_mb']), _mb(phase['max_rss_mb']), _mb(phase['traced_mb']),
+            _mb(phase['traced_peak_mb'])))
+    print('')
+    print('Top allocation sites (traced memory in use after the requests)')
+    for site in report['top_allocation_sites']:
+        print('  {:<48} {} {:>9} blocks'.format(site['site'], _mb(site['size_mb']), site['blocks']))
+    print('')
+    print('Budget: peak RSS {:.1f} MiB, peak traced memory {:.1f} MiB'.format(rss_budget_mb, traced_budget_mb))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rss-budget-mb', type=float, default=RSS_BUDGET_MB, help='peak RSS budget in MiB')
+    parser.add_argument('--traced-budget-mb', type=float, default=TRACED_BUDGET_MB,
+                        help='peak traced memory budget in MiB')
+    parser.add_argument('--top', type=int, default=15, help='number of allocation sites to list')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args(argv)
+
+    report = run(args.top)
+    exceeded = check_budget(report, args.rss_budget_mb, args.traced_budget_mb)
+    if args.json:
+        print(json.dumps(dict(report, exceeded=exceeded), indent=2))
+    else:
+        print_report(report, args.rss_budget_mb, args.traced_budget_mb)
+    for message in exceeded:
+        sys.stderr.write('Over budget: {}\n'.format(message))
+    return 1 if exceeded else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
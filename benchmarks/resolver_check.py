@@ -0,0 +1,136 @@
+"""
+Offline checks of stream URL resolution (lambda/stream_resolver.py).
+
+Local HTTP servers (see local_servers.py) stand in for the stream hosts:
+
+- a 302 redirect to a PLS playlist listing an M3U playlist listing the
+  stream, which resolves to the stream's URL without reading its body
+- playlists recognized by extension only, and by Content-Type only
+- a playlist listing itself, and one listing no stream, which fail
+- StreamUrlResolver keeping the catalog URL while no resolution is in, when
+  the resolution doesn't end on HTTPS (as all local URLs), and when it fails
+- parse_playlist on M3U and PLS bodies
+
+Fails (exit status 1) when any check does.
+
+Usage:
+    python benchmarks/resolver_check.py [--json]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+LAMBDA_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), 'lambda')
+
+os.environ.setdefault('METRICS_ENABLED', 'false')
+sys.path.insert(0, LAMBDA_DIR)
+
+from local_servers import (LocalServer, media, playlist, redirect, status)  # noqa: E402
+from stream_resolver import (MAX_PLAYLIST_DEPTH, StreamUrlResolver, parse_playlist, resolve_stream_url)  # noqa: E402
+
+# Resolving must only read the headers of the endless media response.
+MAX_RESOLVE_SECONDS = 1.0
+
+ROUTES = {
+    '/listen': redirect('/list.pls'),
+    '/list.pls': playlist('[playlist]\nNumberOfEntries=1\nFile1={base}/nested\nTitle1=Nested\nLength1=-1\n',
+                          'audio/x-scpls'),
+    '/nested': playlist('#EXTM3U\n#EXTINF:-1,Live\n{base}/live\n', 'audio/x-mpegurl'),
+    '/live': media,
+    '/station.m3u': playlist('# comment\n\n{base}/live\n', 'text/plain'),
+    '/loop.m3u': playlist('{base}/loop.m3u\n', 'audio/x-mpegurl'),
+    '/empty.pls': playlist('[playlist]\nNumberOfEntries=0\n', 'audio/x-scpls'),
+    '/gone': status(404),
+}
+
+
+def _closed_port_url():
+    # A server that was stopped leaves its port closed.
+    server = LocalServer({})
+    url = server.url('/live')
+    server.stop()
+    return url
+
+
+def _raises(function, *args):
+    try:
+        function(*args)
+    except Exception as e:
+        return '{}: {}'.format(type(e).__name__, e)
+    return None
+
+
+def run():
+    checks = []
+
+    def check(name, passed, detail=None):
+        checks.append({'check': name, 'passed': bool(passed), 'detail': detail})
+
+    check('parse_playlist reads the first File entry of a PLS',
+          parse_playlist('[playlist]\nTitle1=x\nFile1=https://a/1\nFile2=https://a/2\n', 'pls') == 'https://a/1')
+    check('parse_playlist skips the comments of an M3U',
+          parse_playlist('#EXTM3U\n#EXTINF:-1,https://not/this\nhttps://a/1\n', 'm3u') == 'https://a/1')
+    check('parse_playlist ignores relative entries',
+          parse_playlist('#EXTM3U\nlive.mp3\n', 'm3u') is None)
+
+    with LocalServer(ROUTES) as server:
+        started = time.time()
+        resolved = resolve_stream_url(server.url('/listen'))
+        elapsed = time.time() - started
+        check('302 -> PLS -> M3U resolves to the stream', resolved == server.url('/live'), resolved)
+        check('resolving reads only the headers of the stream', elapsed < MAX_RESOLVE_SECONDS,
+              '{:.3f}s'.format(elapsed))
+
+        resolved = resolve_stream_url(server.url('/station.m3u'))
+        check('a playlist is recognized by its extension', resolved == server.url('/live'), resolved)
+
+        error = _raises(resolve_stream_url, server.url('/loop.m3u'))
+        check('a playlist listing itself fails', error is not None and 'nested' in error, error)
+        check('a playlist listing itself is fetched at most MAX_PLAYLIST_DEPTH + 1 times',
+              server.requests.count('/loop.m3u') == MAX_PLAYLIST_DEPTH + 1, server.requests.count('/loop.m3u'))
+
+        error = _raises(resolve_stream_url, server.url('/empty.pls'))
+        check('a playlist without streams fails', error is not None and 'stream' in error, error)
+
+        error = _raises(resolve_stream_url, server.url('/gone'))
+        check('an HTTP error fails', error is not None, error)
+
+        resolver = StreamUrlResolver(enabled=True, ttl=60)
+        catalog_url = server.url('/listen')
+        check('the catalog URL is played while the resolution runs', resolver.get(catalog_url) == catalog_url)
+        resolved = resolver.refresh(catalog_url).result(timeout=5)
+        check('a non-HTTPS resolution keeps the catalog URL',
+              resolved == catalog_url and resolver.get(catalog_url) == catalog_url, resolved)
+
+        closed_url = _closed_port_url()
+        resolved = resolver.refresh(closed_url).result(timeout=5)
+        check('a failed resolution keeps the catalog URL', resolved == closed_url, resolved)
+
+        resolver = StreamUrlResolver(enabled=True, ttl=60, resolve=lambda url: 'https://cdn.example/live')
+        resolver.refresh(catalog_url).result(timeout=5)
+        check('an HTTPS resolution is played', resolver.get(catalog_url) == 'https://cdn.example/live')
+
+    return checks
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args(argv)
+
+    checks = run()
+    if args.json:
+        print(json.dumps(checks, indent=2))
+    else:
+        for result in checks:
+            detail = ' ({})'.format(result['detail']) if result['detail'] is not None else ''
+            print('{} {}{}'.format('ok  ' if result['passed'] else 'FAIL', result['check'], detail))
+    return 0 if all(result['passed'] for result in checks) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""
+Local stand-ins for DynamoDB and the Alexa Device Address API, so the skill
+can be invoked offline. Both can inject latency to mimic the real services.
+"""
+
+import json
+import threading
+import time
+
+from ask_sdk_core.attributes_manager import AbstractPersistenceAdapter
+from ask_sdk_model.services import ApiClientResponse
+from ask_sdk_model.services.api_client import ApiClient
+
+
+def _sleep(latency):
+    if latency:
+        time.sleep(latency)
+
+
+# Persistence adapter keeping items in a dict, keyed by user id.
+# Attributes are round-tripped through JSON like they would be through DynamoDB.
+class InMemoryPersistenceAdapter(AbstractPersistenceAdapter):
+
+    def __init__(self, read_latency=0.0, write_latency=0.0):
+        self.read_latency = read_latency
+        self.write_latency = write_latency
+        self.items = {}
+        self.reads = 0
+        self.writes = 0
+        self._lock = threading.Lock()
+
+    def get_attributes(self, request_envelope):
+        _sleep(self.read_latency)
+        with self._lock:
+            self.reads += 1
+            item = self.items.get(request_envelope.context.system.user.user_id, {})
+        return json.loads(json.dumps(item))
+
+    def save_attributes(self, request_envelope, attributes):
+        _sleep(self.write_latency)
+        with self._lock:
+            self.writes += 1
+            self.items[request_envelope.context.system.user.user_id] = json.loads(json.dumps(attributes))
+
+    def delete_attributes(self, request_envelope):
+        with self._lock:
+            self.items.pop(request_envelope.context.system.user.user_id, None)
+
+
+# ApiClient answering Device Address API calls with a fixed country code, or
+# the one given for the device in country_codes.
+class StubDeviceAddressApiClient(ApiClient):
+
+    def __init__(self, country_code='SG', latency=0.0, status_code=200, country_codes=None):
+        self.country_code = country_code
+        self.country_codes = country_codes if country_codes is not None else {}
+        self.latency = latency
+        self.status_code = status_code
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def invoke(self, request):
+        _sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+        if self.status_code != 200:
+            return ApiClientResponse(headers=[], status_code=self.status_code, body=json.dumps({'message': 'error'}))
+        # /v1/devices/{deviceId}/settings/address/countryAndPostalCode
+        device_id = request.url.split('/v1/devices/', 1)[-1].split('/', 1)[0]
+        country_code = self.country_codes.get(device_id, self.country_code)
+        body = json.dumps({'countryCode': country_code, 'postalCode': '000000'})
+        return ApiClientResponse(headers=[('Content-type', 'application/json')], status_code=200, body=body)
+
+
+# Points the skill builder of an imported lambda_function module at the stand-ins.
+# The persistence stand-in takes the place of the DynamoDB adapter behind the
+# skill's LazyPersistenceAdapter, so unchanged attributes still aren't written.
+def install(lambda_function, persistence_adapter=None, api_client=None):
+    from persistence import LazyPersistenceAdapter
+
+    persistence_adapter = persistence_adapter or InMemoryPersistenceAdapter()
+    api_client = api_client or StubDeviceAddressApiClient()
+    lambda_function.sb.persistence_adapter = LazyPersistenceAdapter(lambda: persistence_adapter)
+    lambda_function.sb.api_client = api_client
+    return persistence_adapter, api_client
@@ -0,0 +1,70 @@
+import functools
+import os
+
+import requests
+
+from ask_sdk_core.api_client import DefaultApiClient
+from ask_sdk_core.exceptions import ApiClientException
+from requests.adapters import HTTPAdapter
+
+# Connect and read timeouts (in seconds) for calls to the Alexa service APIs.
+# DefaultApiClient doesn't pass any timeout to requests, so a slow endpoint
+# blocks the launch for as long as the socket stays open.
+ALEXA_API_CONNECT_TIMEOUT = float(os.environ.get('ALEXA_API_CONNECT_TIMEOUT_SECONDS', '0.5'))
+ALEXA_API_READ_TIMEOUT = float(os.environ.get('ALEXA_API_READ_TIMEOUT_SECONDS', '1.0'))
+
+# Connections kept open per Alexa API host. Calls overlap with the
+# persistence load (see device_location.py), a handful is plenty.
+ALEXA_API_POOL_SIZE = int(os.environ.get('ALEXA_API_POOL_SIZE', '4'))
+
+# Hosts a pool is kept for: a skill's requests come from one region's API
+# endpoint (api.amazonalexa.com, api.eu.amazonalexa.com or api.fe.amazonalexa.com).
+ALEXA_API_HOSTS = 3
+
+HTTP_METHODS = ('get', 'head', 'post', 'put', 'patch', 'delete', 'options')
+
+
+# DefaultApiClient with a strict per-call timeout.
+class TimeoutApiClient(DefaultApiClient):
+
+    def __init__(self, connect_timeout=ALEXA_API_CONNECT_TIMEOUT, read_timeout=ALEXA_API_READ_TIMEOUT):
+        super(TimeoutApiClient, self).__init__()
+        self.timeout = (connect_timeout, read_timeout)
+
+    def _resolve_method(self, request):
+        if request.method is None:
+            raise ApiClientException("Invalid request method: {}".format(request.method))
+        try:
+            http_method = getattr(requests, request.method.lower())
+        except AttributeError:
+            raise ApiClientException("Invalid request method: {}".format(request.method))
+        return functools.partial(http_method, timeout=self.timeout)
+
+
+# TimeoutApiClient that sends every call through one requests.Session.
+#
+# requests.get() and friends build a throwaway Session per call, so every
+# Alexa API call paid for a TCP connect and a TLS handshake. The session's
+# connection pool keeps them open between calls, and between invocations of
+# a warm container. Retries are left to the caller: the address lookup has
+# a deadline of its own.
+class PooledApiClient(TimeoutApiClient):
+
+    def __init__(self, connect_timeout=ALEXA_API_CONNECT_TIMEOUT, read_timeout=ALEXA_API_READ_TIMEOUT,
+                 pool_size=ALEXA_API_POOL_SIZE):
+        super(PooledApiClient, self).__init__(connect_timeout, read_timeout)
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(
+            pool_connections=ALEXA_API_HOSTS, pool_maxsize=pool_size, max_retries=0))
+
+    def _resolve_method(self, request):
+        if request.method is None:
+            raise ApiClientException("Invalid request method: {}".format(request.method))
+        if request.method.lower() not in HTTP_METHODS:
+            raise ApiClientException("Invalid request method: {}".format(request.method))
+        return functools.partial(getattr(self.session, request.method.lower()), timeout=self.timeout)
+
+    # Opens a connection to api_endpoint ahead of the first call. Whatever
+    # the endpoint answers, the connection stays in the pool.
+    def warm_up(self, api_endpoint):
+        self.session.head(api_endpoint, timeout=self.timeout).close()
@@ -0,0 +1,38 @@
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Catalog and language files, validated and compiled into a single file by
+# tools/build_assets.py. Loading it is one read and one JSON parse instead of
+# one per source file.
+ASSET_BUNDLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'compiled_assets.json')
+
+# Bumped whenever the layout of the bundle changes; a bundle in another format is ignored.
+ASSET_BUNDLE_FORMAT = 2
+
+_bundle = None
+
+
+# Returns the compiled asset bundle, or None when there is none (or it can't
+# be used), in which case the source files are read instead.
+def load_asset_bundle(path=ASSET_BUNDLE_PATH):
+    global _bundle
+    if _bundle is not None and path == ASSET_BUNDLE_PATH:
+        return _bundle or None
+    try:
+        with open(path, 'rb') as bundle_file:
+            bundle = json.loads(bundle_file.read().decode('utf-8'))
+        if bundle.get('format') != ASSET_BUNDLE_FORMAT:
+            logger.warning("Ignoring asset bundle %s in format %s", path, bundle.get('format'))
+            bundle = {}
+    except IOError as e:
+        logger.info("No asset bundle, reading the source files: %s", e)
+        bundle = {}
+    except ValueError as e:
+        logger.warning("Unable to load asset bundle %s, reading the source files: %s", path, e)
+        bundle = {}
+    if path == ASSET_BUNDLE_PATH:
+        _bundle = bundle
+    return bundle or None
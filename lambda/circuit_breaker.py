@@ -0,0 +1,88 @@
+import logging
+import threading
+import time
+
+from metrics import put_metric
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Numeric value published for each state, so the state can be graphed and alarmed on.
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+# Classic three state circuit breaker.
+#
+# CLOSED: calls go through, consecutive failures are counted. After
+# failure_threshold failures in a row the breaker OPENs.
+# OPEN: calls are rejected without being made until recovery_timeout seconds
+# passed, then the breaker goes HALF_OPEN.
+# HALF_OPEN: a single trial call is let through. Success closes the breaker,
+# failure opens it again for another recovery_timeout.
+#
+# Every state change and every rejected call is published as a metric with
+# the breaker name as dimension.
+class CircuitBreaker(object):
+
+    def __init__(self, name, failure_threshold=3, recovery_timeout=30.0, clock=time.time):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self):
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def allow_request(self):
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+        put_metric('CircuitBreakerRejected', 1, dimensions={'CircuitBreaker': self.name})
+        return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._trial_in_flight = False
+            if self._state != CLOSED:
+                self._transition(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                self._opened_at = self._clock()
+                self._transition(OPEN)
+
+    def reset(self):
+        with self._lock:
+            self._failures = 0
+            self._trial_in_flight = False
+            self._opened_at = None
+            self._state = CLOSED
+
+    def _maybe_half_open(self):
+        if self._state == OPEN and self._clock() - self._opened_at >= self.recovery_timeout:
+            self._transition(HALF_OPEN)
+
+    def _transition(self, state):
+        logger.warning("Circuit breaker %s changed state from %s to %s", self.name, self._state, state)
+        self._state = state
+        put_metric('CircuitBreakerState', STATE_VALUES[state], unit='None',
+                   dimensions={'CircuitBreaker': self.name}, properties={'state': state})
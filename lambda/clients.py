@@ -0,0 +1,172 @@
+import logging
+import os
+import threading
+
+from ask_sdk_model.services.api_client import ApiClient
+
+logger = logging.getLogger(__name__)
+
+# Settings shared by every AWS client: connect and read timeouts (in
+# seconds), connections kept open per client, and the retry policy. Attempts
+# include the first call. The "standard" mode retries throttling and
+# transient errors with jittered backoff, unlike the "legacy" default.
+AWS_CONNECT_TIMEOUT = float(os.environ.get('AWS_CONNECT_TIMEOUT_SECONDS', '1'))
+AWS_READ_TIMEOUT = float(os.environ.get('AWS_READ_TIMEOUT_SECONDS', '2'))
+AWS_MAX_POOL_CONNECTIONS = int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', '10'))
+AWS_RETRY_MODE = os.environ.get('AWS_RETRY_MODE', 'standard')
+AWS_MAX_ATTEMPTS = int(os.environ.get('AWS_MAX_ATTEMPTS', '3'))
+
+# Comma separated names of the clients to create and connect in the
+# background while the container starts, e.g. "dynamodb,alexa". None by default.
+WARM_UP_CLIENTS = [name.strip() for name in os.environ.get('WARM_UP_CLIENTS', '').split(',') if name.strip()]
+
+# API endpoint the Alexa API client connects to when warmed up. Requests
+# carry their own, this only matters for the warm-up.
+ALEXA_API_ENDPOINT = os.environ.get('ALEXA_API_ENDPOINT', 'https://api.amazonalexa.com')
+
+DYNAMODB = 'dynamodb'
+S3 = 's3'
+ALEXA = 'alexa'
+
+
+# ApiClient that defers building the real client until the first call.
+#
+# The concrete Alexa API client pulls in `requests` (and urllib3, certifi,
+# ...), which is a good part of the cold start. Most invocations never call
+# an Alexa service API, so the import and construction are only paid by the
+# first request that does.
+class LazyApiClient(ApiClient):
+
+    def __init__(self, client_factory):
+        self._client_factory = client_factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._client_factory()
+        return self._client
+
+    def invoke(self, request):
+        return self.client.invoke(request)
+
+
+_aws_config = None
+
+
+# The botocore Config of every AWS client, built once. Service specific
+# settings are merged on top of it.
+def aws_config(**overrides):
+    global _aws_config
+    from botocore.config import Config
+
+    if _aws_config is None:
+        _aws_config = Config(
+            connect_timeout=AWS_CONNECT_TIMEOUT,
+            read_timeout=AWS_READ_TIMEOUT,
+            max_pool_connections=AWS_MAX_POOL_CONNECTIONS,
+            tcp_keepalive=True,
+            retries={'mode': AWS_RETRY_MODE, 'total_max_attempts': AWS_MAX_ATTEMPTS})
+    if overrides:
+        return _aws_config.merge(Config(**overrides))
+    return _aws_config
+
+
+def create_dynamodb_resource():
+    import boto3
+    return boto3.resource('dynamodb', region_name=os.environ.get('DYNAMODB_PERSISTENCE_REGION'), config=aws_config())
+
+
+def create_s3_client():
+    import boto3
+    return boto3.client('s3', region_name=os.environ.get('S3_PERSISTENCE_REGION'),
+                        config=aws_config(signature_version='s3v4', s3={'addressing_style': 'path'}))
+
+
+def create_alexa_api_client():
+    from alexa_api_client import PooledApiClient
+    return PooledApiClient()
+
+
+# Any call opens the connection; the permission to make it doesn't matter.
+def _warm_up_dynamodb(dynamodb_resource):
+    from botocore.exceptions import ClientError
+
+    try:
+        dynamodb_resource.meta.client.describe_endpoints()
+    except ClientError:
+        pass
+
+
+def _warm_up_alexa(api_client):
+    api_client.warm_up(ALEXA_API_ENDPOINT)
+
+
+# Process-wide registry of the AWS and Alexa API clients.
+#
+# Each client is created once per container, on first use, and then shared
+# by every caller so its connection pool (and the TLS sessions in it)
+# survives from one invocation to the next. boto3 clients are thread safe,
+# the io_pool threads can use them too.
+class ClientRegistry(object):
+
+    def __init__(self):
+        self._factories = {}
+        self._warmers = {}
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    # warm_up, if given, is called with the client to open its connections ahead of the first real call.
+    def register(self, name, factory, warm_up=None):
+        self._factories[name] = factory
+        self._warmers[name] = warm_up
+
+    def get(self, name):
+        client = self._clients.get(name)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(name)
+                if client is None:
+                    client = self._factories[name]()
+                    self._clients[name] = client
+        return client
+
+    def preload(self):
+        return self.warm_up()
+
+    def cache_state(self):
+        return {
+            'loaded': bool(self._clients),
+            'entries': len(self._clients),
+            'created': sorted(self._clients),
+            'age_seconds': None,
+            'stale': False,
+        }
+
+    def names(self):
+        return sorted(self._factories)
+
+    # Creates the named clients (all of them by default) and opens their
+    # connections. Failures are logged, warming up is only ever an optimization.
+    # Returns name -> whether the client is ready.
+    def warm_up(self, names=None):
+        ready = {}
+        for name in names if names is not None else self.names():
+            try:
+                client = self.get(name)
+                if self._warmers.get(name) is not None:
+                    self._warmers[name](client)
+                ready[name] = True
+            except Exception as e:
+                logger.warning("Unable to warm up client %s: %s", name, e)
+                ready[name] = False
+        return ready
+
+
+client_registry = ClientRegistry()
+client_registry.register(DYNAMODB, create_dynamodb_resource, warm_up=_warm_up_dynamodb)
+client_registry.register(S3, create_s3_client)
+client_registry.register(ALEXA, create_alexa_api_client, warm_up=_warm_up_alexa)
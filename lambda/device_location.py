@@ -0,0 +1,231 @@
+import logging
+import os
+import threading
+import time
+
+from collections import OrderedDict
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from ask_sdk_model.services import ServiceException
+
+from circuit_breaker import CircuitBreaker
+from io_pool import io_pool
+from request_timing import (timed, ADDRESS_API)
+
+logger = logging.getLogger(__name__)
+
+# How long a device's country code is trusted before the Device Address API is asked again.
+DEVICE_COUNTRY_TTL = int(os.environ.get('DEVICE_COUNTRY_TTL_SECONDS', str(24 * 60 * 60)))
+
+# Number of devices kept in the in-process tier of a warm container.
+DEVICE_COUNTRY_CACHE_SIZE = int(os.environ.get('DEVICE_COUNTRY_CACHE_SIZE', '1024'))
+
+# Consecutive failed address calls before the breaker opens, and how long it stays open.
+ADDRESS_API_FAILURE_THRESHOLD = int(os.environ.get('ADDRESS_API_FAILURE_THRESHOLD', '3'))
+ADDRESS_API_RECOVERY_TIMEOUT = float(os.environ.get('ADDRESS_API_RECOVERY_TIMEOUT_SECONDS', '30'))
+
+# Longest a lookup waits, persistence load included, before giving up on the address call.
+ADDRESS_LOOKUP_DEADLINE = float(os.environ.get('ADDRESS_LOOKUP_DEADLINE_SECONDS', '2'))
+
+# How long the address call waits for the persisted tier before it is made anyway.
+# 0 (the default) overlaps the two round trips; repeat launches on a warm
+# container are answered by the in-process tier without either of them.
+ADDRESS_LOOKUP_GRACE = float(os.environ.get('ADDRESS_LOOKUP_GRACE_SECONDS', '0'))
+
+# Persistent attribute holding the persisted tier, keyed by device id:
+# {"<device_id>": {"country_code": "SG", "fetched_at": 1602928800}}
+PERSISTED_ATTRIBUTE = 'device_country'
+
+
+# In-process LRU of device id -> country code with a per-entry TTL.
+# A country code of None ("no address set on the device") is cached as well.
+class DeviceCountryCache(object):
+
+    def __init__(self, max_size=DEVICE_COUNTRY_CACHE_SIZE, ttl=DEVICE_COUNTRY_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, device_id):
+        with self._lock:
+            entry = self._entries.get(device_id)
+            if entry is None:
+                return False, None
+            country_code, fetched_at = entry
+            if time.time() - fetched_at >= self.ttl:
+                del self._entries[device_id]
+                return False, None
+            self._entries.move_to_end(device_id)
+            return True, country_code
+
+    def put(self, device_id, country_code, fetched_at=None):
+        if fetched_at is None:
+            fetched_at = time.time()
+        with self._lock:
+            self._entries[device_id] = (country_code, fetched_at)
+            self._entries.move_to_end(device_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    # Filled by lookups, there is nothing to preload.
+    def preload(self):
+        pass
+
+    # Stale entries are the ones past their TTL, dropped on their next lookup.
+    def cache_state(self):
+        now = time.time()
+        with self._lock:
+            fetched = [fetched_at for _, fetched_at in self._entries.values()]
+        stale = sum(1 for fetched_at in fetched if now - fetched_at >= self.ttl)
+        return {
+            'loaded': bool(fetched),
+            'entries': len(fetched),
+            'age_seconds': now - min(fetched) if fetched else None,
+            'stale': stale > 0,
+            'stale_entries': stale,
+        }
+
+
+device_country_cache = DeviceCountryCache()
+
+address_api_breaker = CircuitBreaker(
+    'DeviceAddressApi',
+    failure_threshold=ADDRESS_API_FAILURE_THRESHOLD,
+    recovery_timeout=ADDRESS_API_RECOVERY_TIMEOUT)
+
+
+# Raised when the device's country can't be determined right now: the address
+# API failed, timed out, or the circuit breaker is open. Callers are expected
+# to degrade to the persisted or default stream instead of failing the launch.
+class DeviceCountryUnavailable(Exception):
+    pass
+
+
+# The user only has address data available once they granted the location
+# permission, in which case Alexa sends a consent token with the request.
+def has_address_permission(handler_input):
+    permissions = handler_input.request_envelope.context.system.user.permissions
+    return permissions is not None and permissions.consent_token is not None
+
+
+def _get_persisted(persistent_attributes, device_id, ttl):
+    entry = (persistent_attributes.get(PERSISTED_ATTRIBUTE) or {}).get(device_id)
+    if not entry:
+        return False, None, None
+    fetched_at = entry.get('fetched_at', 0)
+    if time.time() - float(fetched_at) >= ttl:
+        return False, None, None
+    return True, entry.get('country_code'), float(fetched_at)
+
+
+def _set_persisted(persistent_attributes, device_id, country_code, fetched_at, ttl):
+    persisted = {}
+    for other_device_id, entry in (persistent_attributes.get(PERSISTED_ATTRIBUTE) or {}).items():
+        # Drop entries of other devices that expired anyway, so the item doesn't grow unbounded.
+        if time.time() - float(entry.get('fetched_at', 0)) < ttl:
+            persisted[other_device_id] = entry
+    persisted[device_id] = {'country_code': country_code, 'fetched_at': int(fetched_at)}
+    persistent_attributes[PERSISTED_ATTRIBUTE] = persisted
+
+
+# Returns the country code of the device the request came from.
+#
+# Lookup order is the in-process LRU, then the copy persisted next to the
+# user's other DynamoDB attributes, and only then the Device Address API.
+# The country-and-postal-code endpoint is used since the country code is the
+# only part of the address the skill needs. A fresh lookup is written to the
+# persistent attributes, the caller is responsible for saving them.
+#
+# On an LRU miss the address call is started on the shared I/O pool while
+# the persistent attributes are loaded (which the caller needs anyway), so a
+# new user waits for the slower of the two round trips, not their sum. A
+# fresh persisted entry answers without waiting for the call. With
+# ADDRESS_LOOKUP_GRACE set, the call first waits that long for the persisted
+# tier and isn't made if it answers, trading new-user latency for fewer
+# calls. The call's result is awaited until ADDRESS_LOOKUP_DEADLINE seconds
+# after the lookup started.
+#
+# A 403 from the address API is raised as ServiceException, so the caller can
+# ask for the location permission. Any other failure, or the deadline
+# passing (which counts as a failure of the address API's circuit breaker),
+# raises DeviceCountryUnavailable.
+def lookup_device_country(handler_input, cache=device_country_cache, deadline=ADDRESS_LOOKUP_DEADLINE,
+                          grace=ADDRESS_LOOKUP_GRACE):
+    device_id = handler_input.request_envelope.context.system.device.device_id
+
+    hit, country_code = cache.get(device_id)
+    if hit:
+        return country_code
+
+    started = time.time()
+    persisted_checked = threading.Event()
+    persisted_hit = threading.Event()
+    short_address_future = io_pool.submit(
+        _fetch_short_address_unless_persisted, handler_input, device_id, persisted_checked, persisted_hit, grace)
+
+    try:
+        persistent_attributes = handler_input.attributes_manager.persistent_attributes
+        hit, country_code, fetched_at = _get_persisted(persistent_attributes, device_id, cache.ttl)
+        if hit:
+            # A call already started finishes unobserved.
+            persisted_hit.set()
+            cache.put(device_id, country_code, fetched_at)
+            return country_code
+    finally:
+        persisted_checked.set()
+
+    try:
+        short_address = short_address_future.result(timeout=max(0.0, started + deadline - time.time()))
+    except FutureTimeoutError:
+        # The call may still complete unobserved, but an API this slow counts
+        # as failing: enough of them open the breaker, and later lookups fail
+        # fast instead of each waiting out the deadline.
+        address_api_breaker.record_failure()
+        logger.warning("Device address lookup didn't complete within %ss", deadline)
+        raise DeviceCountryUnavailable("Device address lookup timed out")
+    country_code = short_address.country_code
+    fetched_at = time.time()
+    cache.put(device_id, country_code, fetched_at)
+    _set_persisted(persistent_attributes, device_id, country_code, fetched_at, cache.ttl)
+    return country_code
+
+
+def _fetch_short_address_unless_persisted(handler_input, device_id, persisted_checked, persisted_hit, grace):
+    if grace > 0:
+        persisted_checked.wait(grace)
+    if persisted_hit.is_set():
+        return None
+    return _fetch_short_address(handler_input, device_id)
+
+
+def _fetch_short_address(handler_input, device_id, breaker=address_api_breaker):
+    if not breaker.allow_request():
+        raise DeviceCountryUnavailable("Circuit breaker {} is open".format(breaker.name))
+    try:
+        device_addr_client = handler_input.service_client_factory.get_device_address_service()
+        with timed(ADDRESS_API):
+            short_address = device_addr_client.get_country_and_postal_code(device_id)
+    except ServiceException as exception:
+        if exception.status_code == 403:
+            # The API answered, the user just hasn't granted the permission.
+            breaker.record_success()
+            raise
+        breaker.record_failure()
+        logger.warning("Device address lookup failed with status %s: %s", exception.status_code, exception)
+        raise DeviceCountryUnavailable(str(exception))
+    except Exception as exception:
+        # E.g. a connection error, or a 200 whose body the SDK can't deserialize.
+        # Counted as a failure too, which also ends a half-open trial call.
+        breaker.record_failure()
+        logger.warning("Device address lookup failed: %r", exception)
+        raise DeviceCountryUnavailable(str(exception))
+    breaker.record_success()
+    return short_address
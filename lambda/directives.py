@@ -0,0 +1,176 @@
+import os
+import threading
+import time
+
+from collections import OrderedDict
+
+from stream_catalog import (stream_catalog, stream_urls, DEFAULT_STREAM_KEY)
+from stream_health import (stream_health, choose_mirror)
+from stream_resolver import stream_resolver
+
+# Token of directives issued before tokens carried the stream, still seen in
+# events for playback that started before a deploy.
+STREAM_TOKEN = 'token'
+
+# Streams whose play directives a warm-up builds ahead of time, the default stream first.
+PRELOADED_STREAMS = int(os.environ.get('PRELOADED_STREAMS', '100'))
+
+# Number of directives kept by a warm container, the least recently played are dropped first.
+PLAY_DIRECTIVE_CACHE_SIZE = int(os.environ.get('PLAY_DIRECTIVE_CACHE_SIZE', '1024'))
+
+
+# Token of a PlayDirective: "<stream key>:<mirror index>:<attempt>". The
+# AudioPlayer events of the playback carry it back, so a PlaybackFailed tells
+# which stream and mirror failed and how many failovers happened already.
+def stream_token(stream_key, mirror_index=0, attempt=0):
+    return '{}:{}:{}'.format(stream_key, mirror_index, attempt)
+
+
+# Returns (stream key, mirror index, attempt), the stream key being None for unknown tokens.
+def parse_stream_token(token):
+    parts = (token or '').rsplit(':', 2)
+    if len(parts) == 3:
+        try:
+            return parts[0], int(parts[1]), int(parts[2])
+        except ValueError:
+            pass
+    return None, 0, 0
+
+
+# URL played by the directive with the given token, None for unknown tokens.
+def url_for_token(token, catalog=stream_catalog):
+    stream_key, mirror_index, _ = parse_stream_token(token)
+    stream_data = catalog.get(stream_key)
+    if stream_data is None:
+        return None
+    urls = stream_urls(stream_data)
+    return urls[mirror_index] if 0 <= mirror_index < len(urls) else None
+
+
+# The display and audioplayer models are imported here rather than at module
+# load, requests answered by the static fast path never build a PlayDirective.
+def build_play_directive(stream_data, url=None, token=STREAM_TOKEN):
+    from ask_sdk_model.interfaces.display import (Image, ImageInstance)
+    from ask_sdk_model.interfaces.audioplayer import (PlayDirective, PlayBehavior, AudioItem, Stream, AudioItemMetadata)
+
+    return PlayDirective(
+        play_behavior = PlayBehavior.REPLACE_ALL,
+        audio_item = AudioItem(
+            stream = Stream(
+                token = token,
+                url = url or stream_data['stream_url'],
+                offset_in_milliseconds = 0
+                ),
+            metadata = AudioItemMetadata(
+                title = stream_data['stream_title'],
+                subtitle = stream_data['stream_subtitle'],
+                art = Image(
+                    sources = [
+                        ImageInstance(
+                            url = stream_data['album_art']
+                        )
+                    ]
+                ),
+                background_image = Image(
+                    sources = [
+                        ImageInstance(
+                            url = stream_data['background_image']
+                        )
+                    ]
+                ),
+            )
+        )
+    )
+
+
+# Memoizes the PlayDirective per catalog key, mirror and attempt.
+#
+# The directive for a stream only depends on its catalog record, so it is
+# built once and the same (treat as immutable) object is added to every
+# response that plays that stream. The cache is tied to the catalog version
+# and dropped as soon as StreamCatalog reloads a changed stream_db.json.
+# Unknown keys resolve to the default stream.
+#
+# Without a mirror index the first mirror that isn't in backoff after a
+# recent failure (see stream_health.py) is played. The URL played is the
+# mirror's resolved URL (see stream_resolver.py): a directive is kept along
+# with the URL it was built for and replaced once the mirror resolves to
+# another one. At most max_size directives are kept, in LRU order.
+class PlayDirectiveCache(object):
+
+    def __init__(self, catalog=stream_catalog, health=stream_health, resolver=stream_resolver,
+                 max_size=PLAY_DIRECTIVE_CACHE_SIZE):
+        self.catalog = catalog
+        self.health = health
+        self.resolver = resolver
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._catalog_version = None
+        self._directives = OrderedDict()
+        self._reset_at = None
+
+    def get(self, stream_key, mirror_index=None, attempt=0):
+        self._check_version()
+        cache_key, url = self._cache_key(stream_key, mirror_index, attempt)
+        with self._lock:
+            entry = self._directives.get(cache_key)
+            if entry is not None and entry[0] == url:
+                self._directives.move_to_end(cache_key)
+                return entry[1]
+        stream_key, mirror_index, attempt = cache_key
+        directive = build_play_directive(
+            self.catalog.get(stream_key), url=url, token=stream_token(stream_key, mirror_index, attempt))
+        with self._lock:
+            self._directives[cache_key] = (url, directive)
+            self._directives.move_to_end(cache_key)
+            while len(self._directives) > self.max_size:
+                self._directives.popitem(last=False)
+        return directive
+
+    # Returns ((stream key, mirror index, attempt), URL to play).
+    def _cache_key(self, stream_key, mirror_index, attempt):
+        if stream_key is None or stream_key not in self.catalog:
+            stream_key = DEFAULT_STREAM_KEY
+        urls = stream_urls(self.catalog.get(stream_key))
+        if mirror_index is None:
+            mirror_index = choose_mirror(urls, self.health)
+        elif not 0 <= mirror_index < len(urls):
+            mirror_index = 0
+        return (stream_key, mirror_index, attempt), self.resolver.get(urls[mirror_index])
+
+    def clear(self):
+        with self._lock:
+            self._directives = OrderedDict()
+
+    def __len__(self):
+        return len(self._directives)
+
+    # Builds the directives of up to max_streams streams, from their preferred mirror.
+    def preload(self, max_streams=PRELOADED_STREAMS):
+        stream_keys = [DEFAULT_STREAM_KEY] + sorted(key for key in self.catalog.keys() if key != DEFAULT_STREAM_KEY)
+        for stream_key in stream_keys[:max_streams]:
+            self.get(stream_key)
+
+    # The directives are stale once the catalog they were built from changed.
+    def cache_state(self):
+        return {
+            'loaded': bool(self._directives),
+            'entries': len(self._directives),
+            'age_seconds': time.time() - self._reset_at if self._reset_at is not None else None,
+            'stale': self._catalog_version != self.catalog.version,
+        }
+
+    def _check_version(self):
+        catalog_version = self.catalog.version
+        if catalog_version != self._catalog_version:
+            with self._lock:
+                self._directives = OrderedDict()
+                self._catalog_version = catalog_version
+                self._reset_at = time.time()
+
+
+play_directive_cache = PlayDirectiveCache()
+
+
+def get_play_directive(stream_key, mirror_index=None, attempt=0):
+    return play_directive_cache.get(stream_key, mirror_index, attempt)
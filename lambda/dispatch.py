@@ -0,0 +1,115 @@
+from ask_sdk_core.skill_builder import CustomSkillBuilder
+from ask_sdk_core.dispatch_components import AbstractRequestHandler
+from ask_sdk_runtime.dispatch_components.request_components import (AbstractRequestMapper, GenericRequestHandlerChain)
+from ask_sdk_runtime.exceptions import RuntimeConfigException
+
+INTENT_REQUEST = "IntentRequest"
+
+
+# Returns the routing key of a request: the intent name for intent requests
+# and the request type for everything else.
+def route_of(request):
+    if request.object_type == INTENT_REQUEST:
+        return (INTENT_REQUEST, request.intent.name)
+    return (request.object_type, None)
+
+
+# Request handler that declares the requests it handles instead of testing for them.
+#
+# request_types lists non-intent request types (e.g. "LaunchRequest") and
+# intent_names the intents it handles. can_handle is derived from them, so
+# a handler keeps working with the SDK's own GenericRequestMapper.
+class RoutedRequestHandler(AbstractRequestHandler):
+    request_types = ()
+    intent_names = ()
+
+    @classmethod
+    def routes(cls):
+        return (
+            [(request_type, None) for request_type in cls.request_types]
+            + [(INTENT_REQUEST, intent_name) for intent_name in cls.intent_names])
+
+    def can_handle(self, handler_input):
+        return route_of(handler_input.request_envelope.request) in self.routes()
+
+
+# Routed handler whose response never depends on the request, the user or any state.
+#
+# Subclasses implement build_response instead of handle. Because the output
+# is always the same, fast_path.StaticResponseFastPath can answer these
+# requests from a cached, pre-serialized envelope without going through the
+# SDK. on_fast_path is called with the raw event when that happens, for side
+# effects (logging, ...) that handle would otherwise have performed.
+class StaticResponseHandler(RoutedRequestHandler):
+
+    def build_response(self, response_builder):
+        raise NotImplementedError
+
+    def handle(self, handler_input):
+        return self.build_response(handler_input.response_builder)
+
+    def on_fast_path(self, event):
+        pass
+
+
+# Request mapper backed by a precomputed route -> handler chain dict.
+#
+# The SDK's GenericRequestMapper calls can_handle on every registered
+# handler in order until one matches, so dispatch cost grows with the number
+# of handlers. Here a request is resolved with a single dict lookup. A guard
+# handler, if set, is asked first and short-circuits the lookup (used for the
+# "device has no audio player" check, which applies to every request).
+class RouteTableRequestMapper(AbstractRequestMapper):
+
+    def __init__(self):
+        self.guard_chain = None
+        self.route_table = {}
+
+    def set_guard_handler(self, request_handler):
+        self.guard_chain = GenericRequestHandlerChain(request_handler=request_handler)
+
+    def add_request_handler(self, request_handler):
+        if not isinstance(request_handler, RoutedRequestHandler):
+            raise RuntimeConfigException(
+                "{} should be a RoutedRequestHandler instance".format(type(request_handler).__name__))
+        routes = request_handler.routes()
+        if not routes:
+            raise RuntimeConfigException(
+                "{} doesn't declare any request types or intent names".format(type(request_handler).__name__))
+        chain = GenericRequestHandlerChain(request_handler=request_handler)
+        for route in routes:
+            if route in self.route_table:
+                raise RuntimeConfigException("{} is claimed by both {} and {}".format(
+                    route[1] or route[0],
+                    type(self.route_table[route].request_handler).__name__,
+                    type(request_handler).__name__))
+            self.route_table[route] = chain
+
+    def get_request_handler_chain(self, handler_input):
+        if self.guard_chain is not None and self.guard_chain.request_handler.can_handle(handler_input):
+            return self.guard_chain
+        return self.route_table.get(route_of(handler_input.request_envelope.request))
+
+
+# CustomSkillBuilder that dispatches through a RouteTableRequestMapper.
+#
+# Routes are registered, and checked for conflicts, as handlers are added, so
+# two handlers claiming the same request fail the module import instead of
+# one of them silently never being called.
+class RoutedSkillBuilder(CustomSkillBuilder):
+
+    def __init__(self, persistence_adapter=None, api_client=None):
+        super(RoutedSkillBuilder, self).__init__(persistence_adapter=persistence_adapter, api_client=api_client)
+        self.request_mapper = RouteTableRequestMapper()
+
+    def add_guard_handler(self, request_handler):
+        self.request_mapper.set_guard_handler(request_handler)
+
+    def add_request_handler(self, request_handler):
+        self.request_mapper.add_request_handler(request_handler)
+
+    @property
+    def skill_configuration(self):
+        skill_config = super(RoutedSkillBuilder, self).skill_configuration
+        skill_config.request_mappers = [self.request_mapper]
+        return skill_config
@@ -0,0 +1,111 @@
+import threading
+
+from ask_sdk_core.response_helper import ResponseFactory
+from ask_sdk_core.utils import RESPONSE_FORMAT_VERSION
+from ask_sdk_model import ResponseEnvelope
+from ask_sdk_runtime.utils import UserAgentManager
+
+from dispatch import (INTENT_REQUEST, StaticResponseHandler)
+
+# Returns the routing key (see dispatch.route_of) of a raw request envelope.
+def route_of_event(event):
+    request = event.get('request') or {}
+    request_type = request.get('type')
+    if request_type == INTENT_REQUEST:
+        return (INTENT_REQUEST, (request.get('intent') or {}).get('name'))
+    return (request_type, None)
+
+
+# Mirrors the CheckAudioInterfaceHandler guard on the raw event: requests from
+# devices without an AudioPlayer interface get a different response.
+def _supports_audio_player(event):
+    device = ((event.get('context') or {}).get('System') or {}).get('device')
+    if device is None:
+        return True
+    return (device.get('supportedInterfaces') or {}).get('AudioPlayer') is not None
+
+
+# Lambda entry point that answers StaticResponseHandler routes from a cache.
+#
+# Pause, playback events and session ends make up most invocations, and
+# their response never changes. For those the raw event is inspected
+# directly and a copy of the pre-serialized response envelope is returned,
+# skipping envelope deserialization, interceptors, the persistence adapter,
+# the response builder and the serializer. The cached envelope is produced
+# by the same handler, ResponseEnvelope and serializer the SDK would use,
+# with sessionAttributes echoed back from the request exactly like
+# CustomSkill.invoke does, so the output is identical to the SDK's.
+#
+# Every other request (or a request the guard handler would take) is passed
+# on to sdk_handler unchanged.
+class StaticResponseFastPath(object):
+
+    def __init__(self, skill_builder, sdk_handler):
+        self.request_mapper = skill_builder.request_mapper
+        self.sdk_handler = sdk_handler
+        self._skill_builder = skill_builder
+        self._serializer = None
+        self._lock = threading.Lock()
+        self._templates = {}
+
+    def __call__(self, event, context):
+        response = self.try_handle(event)
+        if response is not None:
+            return response
+        return self.sdk_handler(event, context)
+
+    def static_handler_for(self, event):
+        if not isinstance(event, dict) or 'request' not in event:
+            return None
+        chain = self.request_mapper.route_table.get(route_of_event(event))
+        if chain is None or not isinstance(chain.request_handler, StaticResponseHandler):
+            return None
+        if not _supports_audio_player(event):
+            return None
+        return chain.request_handler
+
+    def try_handle(self, event):
+        request_handler = self.static_handler_for(event)
+        if request_handler is None:
+            return None
+        has_session = event.get('session') is not None
+        template = self._template(request_handler, has_session)
+        # Shallow copy, the nested response dict is shared between invocations and must not be mutated.
+        response = dict(template)
+        if has_session:
+            response['sessionAttributes'] = event['session'].get('attributes') or {}
+        request_handler.on_fast_path(event)
+        return response
+
+    def clear(self):
+        with self._lock:
+            self._templates = {}
+
+    # Builds the cached envelopes of every static route, with and without a session.
+    def preload(self):
+        for chain in list(self.request_mapper.route_table.values()):
+            if isinstance(chain.request_handler, StaticResponseHandler):
+                self._template(chain.request_handler, True)
+                self._template(chain.request_handler, False)
+
+    # The envelopes only depend on the handlers' code, they are never stale.
+    def cache_state(self):
+        return {'loaded': bool(self._templates), 'entries': len(self._templates), 'age_seconds': None, 'stale': False}
+
+    def _template(self, request_handler, has_session):
+        key = (type(request_handler), has_session)
+        template = self._templates.get(key)
+        if template is None:
+            if self._serializer is None:
+                # Creating the skill registers the SDK's user agent components, the
+                # cached envelope has to carry the same userAgent the SDK sends.
+                self._serializer = self._skill_builder.create().serializer
+            response_envelope = ResponseEnvelope(
+                response=request_handler.build_response(ResponseFactory()),
+                version=RESPONSE_FORMAT_VERSION,
+                session_attributes={} if has_session else None,
+                user_agent=UserAgentManager.get_user_agent())
+            template = self._serializer.serialize(response_envelope)
+            with self._lock:
+                self._templates[key] = template
+        return template
@@ -0,0 +1,34 @@
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+# Worker threads shared by everything that overlaps blocking I/O within an invocation.
+IO_POOL_SIZE = int(os.environ.get('IO_POOL_SIZE', '4'))
+
+
+# Process-wide ThreadPoolExecutor for blocking calls (HTTP, DynamoDB) that
+# can run while the invoking thread does something else.
+#
+# The executor is only created on first use, and then kept for the life of
+# the container so warm invocations don't pay for starting threads.
+class IoPool(object):
+
+    def __init__(self, max_workers=IO_POOL_SIZE):
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='io')
+        return self._executor
+
+    def submit(self, fn, *args, **kwargs):
+        return self.executor.submit(fn, *args, **kwargs)
+
+
+io_pool = IoPool()
@@ -9,33 +9,62 @@
  """
 
 import logging
-import json
 import random
-import requests
 import os
-import boto3
 
-from ask_sdk_core.utils import is_request_type, is_intent_name
-from ask_sdk_core.api_client import DefaultApiClient
-from ask_sdk_core.skill_builder import CustomSkillBuilder
+# Imported first: with MEMORY_PROFILING set it starts tracing allocations, see memory_profiling.py.
+from memory_profiling import memory_profiled_lambda_handler
+
 from ask_sdk_model.ui import AskForPermissionsConsentCard
 from ask_sdk_model.services import ServiceException
-from ask_sdk_dynamodb.adapter import DynamoDbAdapter
-from ask_sdk_model.interfaces.display import (Image, ImageInstance)
 from ask_sdk_core.dispatch_components import (AbstractRequestHandler, AbstractExceptionHandler, AbstractRequestInterceptor, AbstractResponseInterceptor)
-from ask_sdk_model.interfaces.audioplayer import (PlayDirective, PlayBehavior, AudioItem, Stream, AudioItemMetadata,StopDirective, ClearQueueDirective, ClearBehavior)
-from utils import (create_presigned_url, get_stream_data)
-
-# Initializing the logger and setting the level to "INFO"
+from ask_sdk_model.interfaces.audioplayer import (StopDirective, ClearQueueDirective, ClearBehavior)
+from utils import presigned_url_cache
+from stream_catalog import (stream_catalog, stream_urls, DEFAULT_STREAM_KEY)
+from localization import (get_language_prompts, language_prompts_catalog)
+from clients import (client_registry, LazyApiClient, WARM_UP_CLIENTS, DYNAMODB, ALEXA)
+from io_pool import io_pool
+from dispatch import (route_of, RoutedRequestHandler, RoutedSkillBuilder, StaticResponseHandler)
+from fast_path import StaticResponseFastPath
+from directives import (get_play_directive, parse_stream_token, url_for_token, play_directive_cache)
+from stream_health import (stream_health, fail_over)
+from stream_resolver import stream_resolver
+from station_index import (station_directory, station_name)
+from playback_analytics import (playback_analytics, record_playback_event, STARTED, STOPPED, FAILED)
+from persistence import (LazyPersistenceAdapter, get_persisted_stream_key, set_persisted_stream_key)
+from device_location import (DeviceCountryUnavailable, device_country_cache, has_address_permission, lookup_device_country)
+from request_timing import (timed, timed_lambda_handler, timed_invocation, HandlerTimingRequestInterceptor, HandlerTimingResponseInterceptor, LOCALIZATION)
+from structured_logging import (configure_logging, log_sampler, serialize)
+from warm_up import (ContainerWarmer, WarmUpFastPath)
+
+# Initializing the logger, "INFO" unless LOG_LEVEL says otherwise, and switching the
+# log output to single line JSON records (see structured_logging.py).
 # Read more about it here https://www.loggly.com/ultimate-guide/python-logging-basics/
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-
-# Defining the database region, table name and dynamodb persistence adapter
-ddb_region = os.environ.get('DYNAMODB_PERSISTENCE_REGION')
+logger = configure_logging(logging.getLogger(__name__))
+
+# Defining the database table name and dynamodb persistence adapter.
+# The adapter is only created when a handler first reads or writes persistent
+# attributes, and writes are skipped when nothing changed. Its boto3 resource
+# (region, timeouts, pooling) comes from the shared client registry, see clients.py.
+# The adapter module is imported in there as well: importing
+# ask_sdk_dynamodb.adapter builds a boto3 resource as a default argument.
 ddb_table_name = os.environ.get('DYNAMODB_PERSISTENCE_TABLE_NAME')
-ddb_resource = boto3.resource('dynamodb', region_name=ddb_region)
-dynamodb_adapter = DynamoDbAdapter(table_name=ddb_table_name, create_table=False, dynamodb_resource=ddb_resource)
+
+def create_dynamodb_adapter():
+    from ask_sdk_dynamodb.adapter import DynamoDbAdapter
+    return DynamoDbAdapter(table_name=ddb_table_name, create_table=False, dynamodb_resource=client_registry.get(DYNAMODB))
+
+dynamodb_adapter = LazyPersistenceAdapter(create_dynamodb_adapter)
+
+# Session attribute holding the catalog key of the stream offered to the user,
+# to be confirmed with the YesIntent
+SESSION_STREAM_ATTRIBUTE = 'stream_key'
+
+# Slot of the PlayStationIntent holding the spoken station name
+STATION_SLOT = 'station'
+
+# Request attribute set by RequestLogger when the invocation was sampled for logging
+LOG_SAMPLED_ATTRIBUTE = 'log_sampled'
 
 # Define location permissions required by the skill
 location_permissions = ["read::alexa:device:all:address"]
@@ -63,214 +92,160 @@ class CheckAudioInterfaceHandler(AbstractRequestHandler):
             )
 
 # This handler starts the stream playback whenever a user invokes the skill or resumes playback.
-class LaunchRequestHandler(AbstractRequestHandler):
-    def can_handle(self,handler_input):
-        return is_request_type("LaunchRequest")(handler_input)
+class LaunchRequestHandler(RoutedRequestHandler):
+    request_types = ("LaunchRequest",)
 
     def handle(self,handler_input):
         language_prompts = handler_input.attributes_manager.request_attributes["_"]
-        persistent_attributes = handler_input.attributes_manager.persistent_attributes
         session_attributes = handler_input.attributes_manager.session_attributes
         
+        if not has_address_permission(handler_input):
+            return (
+                handler_input.response_builder
+                    .speak(random.choice(language_prompts["ENABLE_LOCATION_PERMISSIONS"]))
+                    .set_card(AskForPermissionsConsentCard(permissions=location_permissions))
+                    .response
+                )
+        
+        location_available = True
         try:
-            device_id = handler_input.request_envelope.context.system.device.device_id
-            device_addr_client = handler_input.service_client_factory.get_device_address_service()
-            full_address = device_addr_client.get_full_address(device_id)
-            print(full_address)
+            country_code = lookup_device_country(handler_input)
         except ServiceException as exception:
-            if exception.status_code == 403:
-                return (
-                    handler_input.response_builder
-                        .speak(random.choice(language_prompts["ENABLE_LOCATION_PERMISSIONS"]))
-                        .set_card(AskForPermissionsConsentCard(permissions=location_permissions))
-                        .response
-                    )
-            else:
-                return (
-                    handler_input.response_builder
-                        .speak(random.choice(language_prompts["ERROR_FETCHING_LOCATION"]))
-                        .set_should_end_session(True)
-                        .response
-                    )
+            return (
+                handler_input.response_builder
+                    .speak(random.choice(language_prompts["ENABLE_LOCATION_PERMISSIONS"]))
+                    .set_card(AskForPermissionsConsentCard(permissions=location_permissions))
+                    .response
+                )
+        except DeviceCountryUnavailable:
+            # Don't let an address API incident block playback, go straight to the
+            # persisted stream or the default one.
+            location_available = False
+            country_code = None
+        
+        persistent_attributes = handler_input.attributes_manager.persistent_attributes
+        stream_key = get_persisted_stream_key(persistent_attributes)
                     
-        if persistent_attributes.get('stream_data') is None:
+        if stream_key is None:
             speech_output = random.choice(language_prompts["WELCOME_MESSAGE"])
-            if full_address.country_code is None:
-                stream_data = get_stream_data('default')
-                speech_output = speech_output + random.choice(language_prompts["ADDRESS_NOT_AVAILABLE"])
-            else:
-                stream_data = get_stream_data(full_address.country_code)
-                if stream_data is not None:
-                    country_name = stream_data['country_name']
+            stream_key = DEFAULT_STREAM_KEY
+            # Without a location there is nothing to tell the user, the default stream just starts.
+            if location_available:
+                if country_code is None:
+                    speech_output = speech_output + random.choice(language_prompts["ADDRESS_NOT_AVAILABLE"])
+                elif country_code in stream_catalog:
+                    stream_key = country_code
+                    country_name = stream_catalog.get(country_code)['country_name']
                     speech_output = speech_output + random.choice(language_prompts["PLAY_COUNTRY_STREAM"]).format(country_name,country_name)
                 else:
-                    stream_data = get_stream_data('default')
                     speech_output = speech_output + random.choice(language_prompts["PLAY_DEFAULT_STREAM"])
                 
-            persistent_attributes['stream_data'] = stream_data
-            handler_input.attributes_manager.save_persistent_attributes()
+            set_persisted_stream_key(persistent_attributes, stream_key)
                 
         else:
             speech_output = random.choice(language_prompts["WELCOME_BACK_MESSAGE"])
-            stream_data = persistent_attributes['stream_data']
-            default_stream_data = get_stream_data('default')
                 
-            if full_address.country_code is not None:
-                if stream_data['stream_url'] == default_stream_data['stream_url']:
-                    new_stream_data = get_stream_data(full_address.country_code)
-                    if new_stream_data is not None:
-                        country_name = new_stream_data['country_name']
-                        speech_output = speech_output + random.choice(language_prompts["COUNTRY_STREAM_AVAILABLE"]).fomat(country_name,country_name)
-                        reprompt = random.choice(language_prompts["COUNTRY_STREAM_AVAILABLE_REPROMPT"])
-                        session_attributes['stream_data'] = new_stream_data
-                        
-                        return (
-                            handler_input.response_builder
-                                .speak(speech_output)
-                                .ask(reprompt)
-                                .response
-                            )
+            if stream_key == DEFAULT_STREAM_KEY and country_code is not None and country_code in stream_catalog:
+                country_name = stream_catalog.get(country_code)['country_name']
+                speech_output = speech_output + random.choice(language_prompts["COUNTRY_STREAM_AVAILABLE"]).format(country_name,country_name)
+                reprompt = random.choice(language_prompts["COUNTRY_STREAM_AVAILABLE_REPROMPT"])
+                session_attributes[SESSION_STREAM_ATTRIBUTE] = country_code
+                
+                handler_input.attributes_manager.save_persistent_attributes()
+                return (
+                    handler_input.response_builder
+                        .speak(speech_output)
+                        .ask(reprompt)
+                        .response
+                    )
+        
+        handler_input.attributes_manager.save_persistent_attributes()
             
         return (
             handler_input.response_builder
                 .speak(speech_output)
-                .add_directive(
-                            PlayDirective(
-                                play_behavior=PlayBehavior.REPLACE_ALL,
-                                audio_item=AudioItem(
-                                    stream=Stream(
-                                        token = 'token',
-                                        url = stream_data['stream_url'],
-                                        offset_in_milliseconds = 0
-                                        ),
-                                    metadata = AudioItemMetadata(
-                                        title = stream_data['stream_title'],
-                                        subtitle = stream_data['stream_subtitle'],
-                                        art = Image(
-                                            sources = [
-                                                ImageInstance(
-                                                    url = stream_data['album_art']
-                                                )
-                                            ]
-                                        ),
-                                        background_image = Image(
-                                            sources = [
-                                                ImageInstance(
-                                                    url = stream_data['background_image']
-                                                )
-                                            ]
-                                        ),
-                                    )
-                                )
-                            )
-                        )
+                .add_directive(get_play_directive(stream_key))
                 .set_should_end_session(True)
                 .response
             )
 
-class YesIntentHandler(AbstractRequestHandler):
-    def can_handle(self,handler_input):
-        return is_intent_name("AMAZON.YesIntent")(handler_input)
+class YesIntentHandler(RoutedRequestHandler):
+    intent_names = ("AMAZON.YesIntent",)
         
     def handle(self,handler_input):
-        language_prompts = handler_input.attributes_manager.request_attributes["_"]
         persistent_attributes = handler_input.attributes_manager.persistent_attributes
         session_attributes = handler_input.attributes_manager.session_attributes
         
-        stream_data = session_attributes['stream_data']
-        persistent_attributes['stream_data'] = stream_data
+        stream_key = session_attributes.get(SESSION_STREAM_ATTRIBUTE)
+        if stream_key is None and session_attributes.get('stream_data'):
+            # Session started before the switch to catalog keys.
+            stream_key = stream_catalog.key_for_url(session_attributes['stream_data'].get('stream_url'))
+        if stream_key is None:
+            stream_key = get_persisted_stream_key(persistent_attributes) or DEFAULT_STREAM_KEY
+        set_persisted_stream_key(persistent_attributes, stream_key)
         handler_input.attributes_manager.save_persistent_attributes()
         
         return ( 
             handler_input.response_builder
-                    .add_directive(
-                        PlayDirective(
-                            play_behavior=PlayBehavior.REPLACE_ALL,
-                            audio_item=AudioItem(
-                                stream=Stream(
-                                    token = 'token',
-                                    url = stream_data['stream_url'],
-                                    offset_in_milliseconds = 0
-                                    ),
-                                metadata = AudioItemMetadata(
-                                    title = stream_data['stream_title'],
-                                    subtitle = stream_data['stream_subtitle'],
-                                    art = Image(
-                                        sources = [
-                                            ImageInstance(
-                                                url = stream_data['album_art']
-                                            )
-                                        ]
-                                    ),
-                                    background_image = Image(
-                                        sources = [
-                                            ImageInstance(
-                                                url = stream_data['background_image']
-                                            )
-                                        ]
-                                    ),
-                                )
-                            )
-                        )
-                    )
+                    .add_directive(get_play_directive(stream_key))
                     .set_should_end_session(True)
                     .response
                 )
 
-class NoIntentHandler(AbstractRequestHandler):
-    def can_handle(self,handler_input):
-        return is_intent_name("AMAZON.NoIntent")(handler_input)
+class NoIntentHandler(RoutedRequestHandler):
+    intent_names = ("AMAZON.NoIntent",)
         
     def handle(self,handler_input):
         persistent_attributes = handler_input.attributes_manager.persistent_attributes
-        stream_data = persistent_attributes['stream_data']
+        stream_key = get_persisted_stream_key(persistent_attributes)
+        handler_input.attributes_manager.save_persistent_attributes()
         
         return ( 
             handler_input.response_builder
-                    .add_directive(
-                        PlayDirective(
-                            play_behavior=PlayBehavior.REPLACE_ALL,
-                            audio_item=AudioItem(
-                                stream=Stream(
-                                    token = 'token',
-                                    url = stream_data['stream_url'],
-                                    offset_in_milliseconds = 0
-                                    ),
-                                metadata = AudioItemMetadata(
-                                    title = stream_data['stream_title'],
-                                    subtitle = stream_data['stream_subtitle'],
-                                    art = Image(
-                                        sources = [
-                                            ImageInstance(
-                                                url = stream_data['album_art']
-                                            )
-                                        ]
-                                    ),
-                                    background_image = Image(
-                                        sources = [
-                                            ImageInstance(
-                                                url = stream_data['background_image']
-                                            )
-                                        ]
-                                    ),
-                                )
-                            )
-                        )
-                    )
+                    .add_directive(get_play_directive(stream_key))
                     .set_should_end_session(True)
                     .response
                 )
 
-class PauseIntentHandler(AbstractRequestHandler):
-    def can_handle(self, handler_input):
+# This handler plays the station the user asked for by name and makes it the user's stream.
+# Entity resolution ids of the STATION_NAME slot type are catalog keys; values Alexa couldn't
+# resolve are looked up in the station name index (see station_index.py).
+class PlayStationIntentHandler(RoutedRequestHandler):
+    intent_names = ("PlayStationIntent",)
+    
+    def handle(self, handler_input):
+        language_prompts = handler_input.attributes_manager.request_attributes["_"]
+        slots = handler_input.request_envelope.request.intent.slots or {}
+        stream_key = station_directory.resolve_slot(slots.get(STATION_SLOT))
+        
+        if stream_key is None:
+            return (
+                handler_input.response_builder
+                    .speak(random.choice(language_prompts["STATION_NOT_FOUND"]))
+                    .ask(random.choice(language_prompts["STATION_NOT_FOUND_REPROMPT"]))
+                    .response
+                )
+        
+        persistent_attributes = handler_input.attributes_manager.persistent_attributes
+        set_persisted_stream_key(persistent_attributes, stream_key)
+        handler_input.attributes_manager.save_persistent_attributes()
+        
+        speech_output = random.choice(language_prompts["PLAY_STATION"]).format(station_name(stream_catalog.get(stream_key)))
         return (
-            is_request_type("PlaybackController.PauseCommandIssued")(handler_input)
-            or is_intent_name("AMAZON.PauseIntent")(handler_input)
+            handler_input.response_builder
+                .speak(speech_output)
+                .add_directive(get_play_directive(stream_key))
+                .set_should_end_session(True)
+                .response
             )
+
+class PauseIntentHandler(StaticResponseHandler):
+    request_types = ("PlaybackController.PauseCommandIssued",)
+    intent_names = ("AMAZON.PauseIntent",)
     
-    def handle(self, handler_input):
+    def build_response(self, response_builder):
         return ( 
-            handler_input.response_builder
+            response_builder
                 .add_directive(
                     ClearQueueDirective(
                         clear_behavior=ClearBehavior.CLEAR_ALL)
@@ -280,68 +255,34 @@ class PauseIntentHandler(AbstractRequestHandler):
                 .response
             )
 
-class ResumeIntentHandler(AbstractRequestHandler):
-    def can_handle(self,handler_input):
-        return (
-            is_request_type("PlaybackController.PlayCommandIssued")(handler_input)
-            or is_intent_name("AMAZON.ResumeIntent")(handler_input)
-            )
+class ResumeIntentHandler(RoutedRequestHandler):
+    request_types = ("PlaybackController.PlayCommandIssued",)
+    intent_names = ("AMAZON.ResumeIntent",)
                 
     def handle(self,handler_input):
-        language_prompts = handler_input.attributes_manager.request_attributes["_"]
         persistent_attributes = handler_input.attributes_manager.persistent_attributes
-        session_attributes = handler_input.attributes_manager.session_attributes
-        
-        stream_data = persistent_attributes['stream_data']
+        stream_key = get_persisted_stream_key(persistent_attributes)
+        handler_input.attributes_manager.save_persistent_attributes()
         
         return ( 
             handler_input.response_builder
-                .add_directive(
-                    PlayDirective(
-                        play_behavior = PlayBehavior.REPLACE_ALL,
-                        audio_item = AudioItem(
-                            stream = Stream(
-                                token = 'token',
-                                url = stream_data['stream_url'],
-                                offset_in_milliseconds = 0
-                                ),
-                            metadata = AudioItemMetadata(
-                                title = stream_data['stream_title'],
-                                subtitle = stream_data['stream_subtitle'],
-                                art = Image(
-                                    sources = [
-                                        ImageInstance(
-                                            url = stream_data['album_art']
-                                        )
-                                    ]
-                                ),
-                                background_image = Image(
-                                    sources = [
-                                        ImageInstance(
-                                            url = stream_data['background_image']
-                                        )
-                                    ]
-                                ),
-                            )
-                        )
-                    )
-                )
+                .add_directive(get_play_directive(stream_key))
                 .set_should_end_session(True)
                 .response
             )
 
 # This handler handles all the required audio player intents which are not supported by the skill yet. 
-class UnhandledFeaturesIntentHandler(AbstractRequestHandler):
-    def can_handle(self,handler_input):
-        return (is_intent_name("AMAZON.LoopOnIntent")(handler_input)
-                or is_intent_name("AMAZON.NextIntent")(handler_input)
-                or is_intent_name("AMAZON.PreviousIntent")(handler_input)
-                or is_intent_name("AMAZON.RepeatIntent")(handler_input)
-                or is_intent_name("AMAZON.ShuffleOnIntent")(handler_input)
-                or is_intent_name("AMAZON.StartOverIntent")(handler_input)
-                or is_intent_name("AMAZON.ShuffleOffIntent")(handler_input)
-                or is_intent_name("AMAZON.LoopOffIntent")(handler_input)
-                )
+class UnhandledFeaturesIntentHandler(RoutedRequestHandler):
+    intent_names = (
+        "AMAZON.LoopOnIntent",
+        "AMAZON.NextIntent",
+        "AMAZON.PreviousIntent",
+        "AMAZON.RepeatIntent",
+        "AMAZON.ShuffleOnIntent",
+        "AMAZON.StartOverIntent",
+        "AMAZON.ShuffleOffIntent",
+        "AMAZON.LoopOffIntent",
+        )
     
     def handle(self, handler_input):
         language_prompts = handler_input.attributes_manager.request_attributes["_"]
@@ -355,9 +296,8 @@ class UnhandledFeaturesIntentHandler(AbstractRequestHandler):
 
 # This handler provides the user with basic info about the skill when a user asks for it.
 # Note: This would only work with one shot utterances and not during stream playback.
-class AboutIntentHandler(AbstractRequestHandler):
-    def can_handle(self, handler_input):
-        return is_intent_name("AboutIntent")(handler_input)
+class AboutIntentHandler(RoutedRequestHandler):
+    intent_names = ("AboutIntent",)
     
     def handle(self, handler_input):
         language_prompts = handler_input.attributes_manager.request_attributes["_"]
@@ -371,9 +311,8 @@ class AboutIntentHandler(AbstractRequestHandler):
                 .response
             )
 
-class HelpIntentHandler(AbstractRequestHandler):
-    def can_handle(self, handler_input):
-        return is_intent_name("AMAZON.HelpIntent")(handler_input)
+class HelpIntentHandler(RoutedRequestHandler):
+    intent_names = ("AMAZON.HelpIntent",)
     
     def handle(self, handler_input):
         language_prompts = handler_input.attributes_manager.request_attributes["_"]
@@ -387,12 +326,8 @@ class HelpIntentHandler(AbstractRequestHandler):
                 .response
             )
 
-class CancelOrStopIntentHandler(AbstractRequestHandler):
-    def can_handle(self, handler_input):
-        return (
-            is_intent_name("AMAZON.CancelIntent")(handler_input)
-            or is_intent_name("AMAZON.StopIntent")(handler_input)
-            )
+class CancelOrStopIntentHandler(RoutedRequestHandler):
+    intent_names = ("AMAZON.CancelIntent", "AMAZON.StopIntent")
     
     def handle(self, handler_input):
         language_prompts = handler_input.attributes_manager.request_attributes["_"]
@@ -403,27 +338,54 @@ class CancelOrStopIntentHandler(AbstractRequestHandler):
                 .response
             )
 
-class PlaybackStartedEventHandler(AbstractRequestHandler):
-    def can_handle(self, handler_input):
-        return is_request_type("AudioPlayer.PlaybackStarted")(handler_input)
+# A started playback also marks the stream URL it plays as healthy, and is recorded for analytics.
+class PlaybackStartedEventHandler(StaticResponseHandler):
+    request_types = ("AudioPlayer.PlaybackStarted",)
     
     def handle(self, handler_input):
-        return ( handler_input.response_builder
+        request = handler_input.request_envelope.request
+        self.record_playback(request.token)
+        playback_analytics.record(
+            STARTED, handler_input.request_envelope.context.system.device.device_id, request.token,
+            request.offset_in_milliseconds)
+        return self.build_response(handler_input.response_builder)
+    
+    def build_response(self, response_builder):
+        return ( response_builder
                     .add_directive(
                         ClearQueueDirective(
                             clear_behavior=ClearBehavior.CLEAR_ENQUEUED)
                         )
                     .response
                 )
-
-class PlaybackStoppedEventHandler(AbstractRequestHandler):
-    def can_handle(self, handler_input):
-        return ( is_request_type("PlaybackController.PauseCommandIssued")(handler_input)
-                or is_request_type("AudioPlayer.PlaybackStopped")(handler_input)
-            )
+    
+    def on_fast_path(self, event):
+        self.record_playback(event['request'].get('token'))
+        record_playback_event(STARTED, event)
+    
+    def record_playback(self, token):
+        stream_url = url_for_token(token)
+        if stream_url is not None:
+            stream_health.record_success(stream_url)
+
+# PlaybackController.PauseCommandIssued is handled by the PauseIntentHandler, which was
+# registered first and therefore always won the can_handle scan.
+# The stop, and with its offset how long the stream played, is recorded for analytics.
+class PlaybackStoppedEventHandler(StaticResponseHandler):
+    request_types = ("AudioPlayer.PlaybackStopped",)
     
     def handle(self, handler_input):
-        return ( handler_input.response_builder
+        request = handler_input.request_envelope.request
+        playback_analytics.record(
+            STOPPED, handler_input.request_envelope.context.system.device.device_id, request.token,
+            request.offset_in_milliseconds)
+        return self.build_response(handler_input.response_builder)
+    
+    def on_fast_path(self, event):
+        record_playback_event(STOPPED, event)
+    
+    def build_response(self, response_builder):
+        return ( response_builder
                     .add_directive(
                         ClearQueueDirective(
                             clear_behavior=ClearBehavior.CLEAR_ALL)
@@ -433,19 +395,49 @@ class PlaybackStoppedEventHandler(AbstractRequestHandler):
                     .response
                 )
 
-# This handler tries to play the stream again if the playback failed due to any reason.
-class PlaybackFailedEventHandler(AbstractRequestHandler):
-    def can_handle(self, handler_input):
-        return is_request_type("AudioPlayer.PlaybackFailed")(handler_input)
+# This handler tries to play the stream again if the playback failed due to any reason, from the
+# next mirror of the stream that isn't known to be down (see stream_health.py), or from the default
+# stream once all of them are. The directive token tells which stream and mirror failed and how many
+# times in a row; after STREAM_FAILOVER_MAX_ATTEMPTS failovers the playback is given up.
+class PlaybackFailedEventHandler(RoutedRequestHandler):
+    request_types = ("AudioPlayer.PlaybackFailed",)
     
-    def handle(self,handler_input):
-        return handler_input.response_builder.response
+    def handle(self, handler_input):
+        request = handler_input.request_envelope.request
+        stream_key, mirror_index, attempt = parse_stream_token(request.token)
+        if stream_key is None or stream_key not in stream_catalog:
+            # Played from a directive without a stream token, it was the user's stream.
+            persistent_attributes = handler_input.attributes_manager.persistent_attributes
+            stream_key = get_persisted_stream_key(persistent_attributes)
+            if stream_key is None or stream_key not in stream_catalog:
+                stream_key = DEFAULT_STREAM_KEY
+        
+        playback_state = request.current_playback_state
+        played_ms = (playback_state.offset_in_milliseconds or 0) if playback_state is not None else 0
+        playback_analytics.record(
+            FAILED, handler_input.request_envelope.context.system.device.device_id, request.token, played_ms,
+            error_type=request.error.object_type.value if request.error is not None and request.error.object_type else None)
+        urls = stream_urls(stream_catalog.get(stream_key))
+        if 0 <= mirror_index < len(urls):
+            # The resolved URL may be the part that went away, resolve the mirror again next time.
+            stream_resolver.invalidate(urls[mirror_index])
+        fallback_urls = stream_urls(stream_catalog.get(DEFAULT_STREAM_KEY)) if stream_key != DEFAULT_STREAM_KEY else ()
+        failover = fail_over(stream_key, urls, mirror_index, attempt, played_ms=played_ms,
+                             fallback_key=DEFAULT_STREAM_KEY, fallback_urls=fallback_urls)
+        if failover is None:
+            return handler_input.response_builder.response
+        
+        stream_key, mirror_index, attempt = failover
+        return (
+            handler_input.response_builder
+                .add_directive(get_play_directive(stream_key, mirror_index, attempt))
+                .response
+            )
     
 
 # This handler handles utterances that can't be matched to any other intent handler.
-class FallbackIntentHandler(AbstractRequestHandler):
-    def can_handle(self, handler_input):
-        return is_intent_name("AMAZON.FallbackIntent")(handler_input)
+class FallbackIntentHandler(RoutedRequestHandler):
+    intent_names = ("AMAZON.FallbackIntent",)
     
     def handle(self, handler_input):
         language_prompts = handler_input.attributes_manager.request_attributes["_"]
@@ -460,53 +452,63 @@ class FallbackIntentHandler(AbstractRequestHandler):
             )
 
 
-class SessionEndedRequestHandler(AbstractRequestHandler):
-    def can_handle(self, handler_input):
-        return is_request_type("SessionEndedRequest")(handler_input)
+class SessionEndedRequestHandler(StaticResponseHandler):
+    request_types = ("SessionEndedRequest",)
     
     def handle(self, handler_input):
-        logger.info("Session ended with reason: {}".format(handler_input.request_envelope.request.reason))
-        return handler_input.response_builder.response
+        logger.info("Session ended with reason: %s", handler_input.request_envelope.request.reason)
+        return self.build_response(handler_input.response_builder)
+    
+    def build_response(self, response_builder):
+        return response_builder.response
+    
+    def on_fast_path(self, event):
+        logger.info("Session ended with reason: %s", event['request'].get('reason'))
 
 
-class ExceptionEncounteredRequestHandler(AbstractRequestHandler):
-    def can_handle(self, handler_input):
-        return is_request_type("System.ExceptionEncountered")(handler_input)
+class ExceptionEncounteredRequestHandler(RoutedRequestHandler):
+    request_types = ("System.ExceptionEncountered",)
     
     def handle(self, handler_input):
-        logger.info("Session ended with reason: {}".format(handler_input.request_envelope.request.reason))
+        logger.info("Session ended with reason: %s", handler_input.request_envelope.request.reason)
         return handler_input.response_builder.response
 
 # Interceptors
 
-# This interceptor is used for supporting different languages and locales. It detects the users locale,
-# loads the corresponding language prompts and sends them as a request attribute object to the handler functions.
+# This interceptor is used for supporting different languages and locales. It detects the users locale
+# and sends the matching language prompts as a request attribute object to the handler functions.
+# All language files are loaded once at cold start (see localization.py), so this is a dict lookup
+# that hands out a shared read-only mapping.
 class LocalizationInterceptor(AbstractRequestInterceptor):
 
     def process(self, handler_input):
-        locale = handler_input.request_envelope.request.locale
-        
-        try:
-            with open("languages/"+str(locale)+".json") as language_data:
-                language_prompts = json.load(language_data)
-        except:
-            with open("languages/"+ str(locale[:2]) +".json") as language_data:
-                language_prompts = json.load(language_data)
-        
-        handler_input.attributes_manager.request_attributes["_"] = language_prompts
+        with timed(LOCALIZATION):
+            locale = handler_input.request_envelope.request.locale
+            handler_input.attributes_manager.request_attributes["_"] = get_language_prompts(locale)
 
-# This interceptor logs each request sent from Alexa to our endpoint.
+# This interceptor logs the requests sent from Alexa to our endpoint, at DEBUG level and sampled
+# per request type (LOG_SAMPLE_RATES). The request is only serialized once the record is written,
+# device ids, user ids and addresses are redacted by the formatter.
 class RequestLogger(AbstractRequestInterceptor):
 
     def process(self, handler_input):
-        logger.debug("Alexa Request: {}".format(
-            handler_input.request_envelope.request))
-
-# This interceptor logs each response our endpoint sends back to Alexa.
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
+        request = handler_input.request_envelope.request
+        request_type, intent_name = route_of(request)
+        request_type = intent_name or request_type
+        if not log_sampler.sampled(request_type):
+            return
+        handler_input.attributes_manager.request_attributes[LOG_SAMPLED_ATTRIBUTE] = True
+        logger.debug("Alexa Request", extra={'fields': lambda: {'requestType': request_type, 'request': serialize(request)}})
+
+# This interceptor logs the response our endpoint sends back to Alexa, for the requests RequestLogger logged.
 class ResponseLogger(AbstractResponseInterceptor):
 
     def process(self, handler_input, response):
-        logger.debug("Alexa Response: {}".format(response))
+        if not handler_input.attributes_manager.request_attributes.get(LOG_SAMPLED_ATTRIBUTE):
+            return
+        logger.debug("Alexa Response", extra={'fields': lambda: {'response': serialize(response)}})
 
 # This exception handler handles syntax or routing errors. If you receive an error stating 
 # the request handler is not found, you have not implemented a handler for the intent or 
@@ -519,7 +521,10 @@ class CatchAllExceptionHandler(AbstractExceptionHandler):
     def handle(self, handler_input, exception):
         logger.error(exception, exc_info=True)
         
-        language_prompts = handler_input.attributes_manager.request_attributes["_"]
+        # The exception may have been raised before the LocalizationInterceptor ran.
+        language_prompts = handler_input.attributes_manager.request_attributes.get("_")
+        if language_prompts is None:
+            language_prompts = get_language_prompts(getattr(handler_input.request_envelope.request, 'locale', None))
         
         speech_output = language_prompts["ERROR"]
         reprompt = language_prompts["ERROR_REPROMPT"]
@@ -534,10 +539,15 @@ class CatchAllExceptionHandler(AbstractExceptionHandler):
 # Skill Builder
 # Define a skill builder instance and add all the request handlers,
 # exception handlers and interceptors to it.
+# Requests are dispatched through a route table built from the request types and intent names
+# each handler declares (see dispatch.py); the audio interface check runs before the lookup.
 
-sb = CustomSkillBuilder(api_client=DefaultApiClient(), persistence_adapter = dynamodb_adapter)
-sb.add_request_handler(CheckAudioInterfaceHandler())
+sb = RoutedSkillBuilder(api_client=LazyApiClient(lambda: client_registry.get(ALEXA)), persistence_adapter = dynamodb_adapter)
+sb.add_guard_handler(CheckAudioInterfaceHandler())
 sb.add_request_handler(LaunchRequestHandler())
+sb.add_request_handler(YesIntentHandler())
+sb.add_request_handler(NoIntentHandler())
+sb.add_request_handler(PlayStationIntentHandler())
 sb.add_request_handler(PauseIntentHandler())
 sb.add_request_handler(ResumeIntentHandler())
 sb.add_request_handler(UnhandledFeaturesIntentHandler())
@@ -554,6 +564,35 @@ sb.add_exception_handler(CatchAllExceptionHandler())
 
 sb.add_global_request_interceptor(LocalizationInterceptor())
 sb.add_global_request_interceptor(RequestLogger())
+sb.add_global_request_interceptor(HandlerTimingRequestInterceptor())
+sb.add_global_response_interceptor(HandlerTimingResponseInterceptor())
 sb.add_global_response_interceptor(ResponseLogger())
 
-lambda_handler = sb.lambda_handler()
+# Requests served by a StaticResponseHandler are answered from a cached response envelope
+# without entering the SDK, everything else goes through the skill as usual, with the
+# time spent in each phase emitted as an EMF record (see request_timing.py).
+static_response_fast_path = StaticResponseFastPath(sb, timed_lambda_handler(sb))
+
+# Scheduled warm-up invocations (see warm_up.py) never reach the SDK: they preload
+# the catalog, prompts, cached responses and clients, and report the state of each cache.
+container_warmer = ContainerWarmer([
+    ('stream_catalog', stream_catalog),
+    ('language_prompts', language_prompts_catalog),
+    ('station_index', station_directory),
+    ('play_directives', play_directive_cache),
+    ('static_responses', static_response_fast_path),
+    ('persistence', dynamodb_adapter),
+    ('clients', client_registry),
+    ('device_countries', device_country_cache),
+    ('presigned_urls', presigned_url_cache),
+])
+
+# Every invocation, whichever of the paths above answers it, emits its total time
+# (see request_timing.timed_invocation). With MEMORY_PROFILING set, the memory used by
+# every invocation and its top allocation sites are reported as well (see memory_profiling.py).
+lambda_handler = memory_profiled_lambda_handler(timed_invocation(WarmUpFastPath(container_warmer, static_response_fast_path)))
+
+# Clients listed in WARM_UP_CLIENTS connect in the background while the container
+# starts, so the first request that needs them doesn't wait for a TLS handshake.
+if WARM_UP_CLIENTS:
+    io_pool.submit(client_registry.warm_up, WARM_UP_CLIENTS)
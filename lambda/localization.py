@@ -0,0 +1,144 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import time
+
+from types import MappingProxyType
+
+from asset_bundle import (load_asset_bundle, ASSET_BUNDLE_PATH)
+
+logger = logging.getLogger(__name__)
+
+LANGUAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'languages')
+
+# Locale whose prompts are used when neither the exact locale nor its
+# two-letter language has a file, and to fill keys a locale file doesn't define.
+DEFAULT_LOCALE = 'en-US'
+
+
+def _freeze(value):
+    if isinstance(value, list):
+        return tuple(value)
+    return value
+
+
+def _read_language_files(languages_dir):
+    language_files = {}
+    for path in sorted(glob.glob(os.path.join(languages_dir, '*.json'))):
+        locale = os.path.splitext(os.path.basename(path))[0]
+        with open(path) as language_data:
+            language_files[locale] = json.load(language_data)
+    return language_files
+
+
+# Whether the language files are still the ones compiled into the bundle.
+#
+# The bundle records the size and SHA-1 of every file. A file is stat()ed
+# and only hashed when it is newer than the bundle, which is the case after
+# an edit, but also when a checkout happened to write it after the bundle.
+def _bundle_is_current(language_sources, languages_dir, bundle_path=ASSET_BUNDLE_PATH):
+    if language_sources is None:
+        return False
+    paths = glob.glob(os.path.join(languages_dir, '*.json'))
+    if set(os.path.splitext(os.path.basename(path))[0] for path in paths) != set(language_sources):
+        return False
+    try:
+        bundle_mtime = os.stat(bundle_path).st_mtime
+        for path in paths:
+            source = language_sources[os.path.splitext(os.path.basename(path))[0]]
+            stat = os.stat(path)
+            if stat.st_size != source['size']:
+                return False
+            if stat.st_mtime > bundle_mtime:
+                with open(path, 'rb') as language_file:
+                    if hashlib.sha1(language_file.read()).hexdigest() != source['sha1']:
+                        return False
+    except OSError:
+        return False
+    return True
+
+
+# Returns the fallback chain for a locale, most specific first,
+# e.g. en-GB -> en -> en-US.
+def fallback_chain(locale, default_locale=DEFAULT_LOCALE):
+    chain = []
+    if locale:
+        chain.append(locale)
+        if len(locale) > 2:
+            chain.append(locale[:2])
+    if default_locale not in chain:
+        chain.append(default_locale)
+        if len(default_locale) > 2 and default_locale[:2] not in chain:
+            chain.append(default_locale[:2])
+    return chain
+
+
+def _resolve(language_files, locale, default_locale):
+    language_prompts = {}
+    for fallback_locale in reversed(fallback_chain(locale, default_locale)):
+        for key, value in language_files.get(fallback_locale, {}).items():
+            language_prompts[key] = _freeze(value)
+    return MappingProxyType(language_prompts)
+
+
+# Locale -> prompts map with the fallback chain resolved ahead of time.
+#
+# Every language file is read once when the container starts, or taken from
+# the asset bundle when there is one and the files haven't changed since it
+# was built. Each locale
+# gets a single shared, read-only mapping (lists are frozen to tuples), so
+# handing the prompts to a request is a dict lookup with no file I/O or JSON
+# parsing. Unknown locales resolve through their two-letter language to the
+# default locale and are memoized, they never raise.
+class LanguagePrompts(object):
+
+    def __init__(self, languages_dir=LANGUAGES_DIR, default_locale=DEFAULT_LOCALE, bundle=None):
+        self.languages_dir = languages_dir
+        self.default_locale = default_locale
+        if bundle is not None and 'language_files' in bundle:
+            if _bundle_is_current(bundle.get('language_sources'), languages_dir):
+                self._language_files = bundle['language_files']
+            else:
+                logger.warning("Language files changed since the asset bundle was built, "
+                               "run tools/build_assets.py; reading the files")
+                bundle = None
+        if bundle is None or 'language_files' not in bundle:
+            self._language_files = _read_language_files(languages_dir)
+        if default_locale not in self._language_files:
+            logger.error("Default locale %s has no language file in %s", default_locale, languages_dir)
+        self._resolved = dict(
+            (locale, _resolve(self._language_files, locale, default_locale))
+            for locale in self._language_files)
+        self._loaded_at = time.time()
+
+    def locales(self):
+        return sorted(self._language_files.keys())
+
+    def get(self, locale):
+        language_prompts = self._resolved.get(locale)
+        if language_prompts is None:
+            language_prompts = _resolve(self._language_files, locale, self.default_locale)
+            self._resolved[locale] = language_prompts
+        return language_prompts
+
+    # Everything is loaded when the container starts, there is nothing left to preload.
+    def preload(self):
+        pass
+
+    # Prompts never change within a container's life, they are never stale.
+    def cache_state(self):
+        return {
+            'loaded': bool(self._language_files),
+            'entries': len(self._resolved),
+            'age_seconds': time.time() - self._loaded_at,
+            'stale': False,
+        }
+
+
+language_prompts_catalog = LanguagePrompts(bundle=load_asset_bundle())
+
+
+def get_language_prompts(locale):
+    return language_prompts_catalog.get(locale)
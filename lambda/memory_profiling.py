@@ -0,0 +1,215 @@
+# Only standard library modules are imported before tracing starts, so
+# everything lambda_function imports after this module is traced. metrics and
+# structured_logging (which loads the SDK models) are imported by the profiler.
+import logging
+import os
+import sys
+import sysconfig
+import time
+
+# Set MEMORY_PROFILING=true to trace allocations and report the memory use of every invocation.
+# Tracing slows every allocation down, this is meant for a test alias, not for production traffic.
+MEMORY_PROFILING = os.environ.get('MEMORY_PROFILING', 'false').lower() in ('1', 'true', 'yes')
+
+# Allocation sites reported per invocation, and stack frames kept per allocation
+# (see top_allocation_sites).
+MEMORY_PROFILING_TOP = int(os.environ.get('MEMORY_PROFILING_TOP', '10'))
+MEMORY_PROFILING_FRAMES = int(os.environ.get('MEMORY_PROFILING_FRAMES', '1'))
+
+if MEMORY_PROFILING:
+    import tracemalloc
+
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(MEMORY_PROFILING_FRAMES)
+
+logger = logging.getLogger(__name__)
+
+MIB = 1024.0 * 1024.0
+
+
+# Highest resident set size of the process so far, in bytes.
+def peak_rss_bytes():
+    import resource
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+# Current resident set size of the process in bytes, None where /proc isn't available.
+def current_rss_bytes():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, ValueError, AttributeError):
+        return None
+
+
+# The standard library and the import machinery allocate on behalf of their
+# caller, so an allocation is attributed to the innermost frame of its
+# traceback outside of them: json.loads() called by botocore counts for
+# botocore, compiling a module for the line importing it.
+_STDLIB_DIR = os.path.normcase(sysconfig.get_paths()['stdlib']) + os.sep
+_SITE_PACKAGES_DIRS = tuple(
+    os.path.normcase(sysconfig.get_paths()[name]) + os.sep for name in ('purelib', 'platlib'))
+_LAMBDA_DIR = os.path.dirname(os.path.abspath(__file__)) + os.sep
+_attributable = {}
+
+
+def _is_attributable(filename):
+    if filename not in _attributable:
+        path = os.path.normcase(filename)
+        _attributable[filename] = not filename.startswith('<') and (
+            not path.startswith(_STDLIB_DIR) or path.startswith(_SITE_PACKAGES_DIRS))
+    return _attributable[filename]
+
+
+def allocation_frame(traceback):
+    for frame in reversed(traceback):
+        if _is_attributable(frame.filename):
+            return frame
+    return traceback[-1]
+
+
+# Top-level package of an installed module, "lambda/<file>" for the function's
+# own modules, "(standard library)" when no frame outside it was traced.
+def allocation_package(traceback):
+    frame = allocation_frame(traceback)
+    if not _is_attributable(frame.filename):
+        return '(standard library)'
+    path = os.path.normcase(frame.filename)
+    for site_packages in _SITE_PACKAGES_DIRS:
+        if path.startswith(site_packages):
+            return path[len(site_packages):].split(os.sep)[0]
+    filename = os.path.abspath(frame.filename)
+    if filename.startswith(_LAMBDA_DIR):
+        return 'lambda/' + filename[len(_LAMBDA_DIR):]
+    return frame.filename
+
+
+def _allocation_line(traceback):
+    frame = allocation_frame(traceback)
+    return '{}:{}'.format(frame.filename, frame.lineno)
+
+
+# Top allocation sites of a tracemalloc snapshot, or of what grew since a
+# previous one, largest first, as (site, size in bytes, allocated blocks)
+# tuples. A site is a source line, or a package with by_package. Allocations
+# are only attributed past the standard library (see allocation_frame) when
+# more than one frame is traced, which makes the report a lot slower.
+def top_allocation_sites(snapshot, previous=None, limit=MEMORY_PROFILING_TOP, by_package=False):
+    import tracemalloc
+
+    key_type = 'traceback' if snapshot.traceback_limit > 1 else 'lineno'
+    if previous is not None:
+        statistics = [(statistic.traceback, statistic.size_diff, statistic.count_diff)
+                      for statistic in snapshot.compare_to(previous, key_type)]
+    else:
+        statistics = [(statistic.traceback, statistic.size, statistic.count)
+                      for statistic in snapshot.statistics(key_type)]
+    site_of = allocation_package if by_package else _allocation_line
+    # Leave out the snapshots themselves, and the previous report.
+    own_files = (tracemalloc.__file__, __file__)
+    sites = {}
+    for traceback, size, count in statistics:
+        if traceback[-1].filename in own_files:
+            continue
+        site = site_of(traceback)
+        site_size, site_count = sites.get(site, (0, 0))
+        sites[site] = (site_size + size, site_count + count)
+    sites = sorted(((site, size, count) for site, (size, count) in sites.items() if size > 0),
+                   key=lambda site: -site[1])
+    return sites[:limit]
+
+
+# Records the memory use of each invocation with tracemalloc.
+#
+# With MEMORY_PROFILING set, tracing starts as soon as this module is
+# imported, first thing in lambda_function, so the imports are traced too.
+# For each invocation the traced memory (current and peak) and the process
+# RSS (current and peak) are emitted as EMF metrics, with the RequestType
+# dimension, and the allocation sites that grew the most during the
+# invocation are logged. The very first invocation logs the top sites of
+# everything allocated since tracing started, i.e. the cold start.
+#
+# Tracing and the snapshot kept from the previous invocation take memory
+# themselves, the RSS figures are higher than without profiling; the
+# untraced footprint is measured by benchmarks/memory_budget.py.
+class MemoryProfiler(object):
+
+    def __init__(self, frames=MEMORY_PROFILING_FRAMES, top=MEMORY_PROFILING_TOP):
+        import tracemalloc
+        from metrics import put_metrics
+        from structured_logging import configure_logging
+
+        configure_logging(logger)
+        self.tracemalloc = tracemalloc
+        self.put_metrics = put_metrics
+        self.top = top
+        self.invocations = 0
+        self._snapshot = None
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    def begin(self):
+        # Python < 3.9 can't reset the peak, it then covers the container's life.
+        if hasattr(self.tracemalloc, 'reset_peak'):
+            self.tracemalloc.reset_peak()
+        return time.time()
+
+    def finish(self, request_type, started=None):
+        duration_ms = (time.time() - started) * 1000 if started is not None else None
+        traced, traced_peak = self.tracemalloc.get_traced_memory()
+        rss = current_rss_bytes()
+        peak_rss = peak_rss_bytes()
+        snapshot = self.tracemalloc.take_snapshot()
+        sites = [{'site': site, 'kib': round(size / 1024.0, 1), 'blocks': count}
+                 for site, size, count in top_allocation_sites(snapshot, self._snapshot, self.top)]
+        self._snapshot = snapshot
+        self.invocations += 1
+
+        measurements = {
+            'TracedMemory': (traced / MIB, 'Megabytes'),
+            'TracedPeakMemory': (traced_peak / MIB, 'Megabytes'),
+            'MaxRss': (peak_rss / MIB, 'Megabytes'),
+        }
+        if rss is not None:
+            measurements['Rss'] = (rss / MIB, 'Megabytes')
+        self.put_metrics(measurements, dimensions={'RequestType': request_type or 'Unknown'})
+        logger.info("Memory profile", extra={'fields': {
+            'requestType': request_type,
+            'invocation': self.invocations,
+            'tracedMiB': round(traced / MIB, 2),
+            'tracedPeakMiB': round(traced_peak / MIB, 2),
+            'rssMiB': round(rss / MIB, 2) if rss is not None else None,
+            'maxRssMiB': round(peak_rss / MIB, 2),
+            'durationMs': round(duration_ms, 1) if duration_ms is not None else None,
+            'topAllocationSites': sites,
+        }})
+
+
+memory_profiler = MemoryProfiler() if MEMORY_PROFILING else None
+
+
+# Wraps a Lambda entry point with memory_profiler when MEMORY_PROFILING is
+# set. Otherwise handler is returned as is, and nothing is traced.
+def memory_profiled_lambda_handler(handler, profiler=None):
+    profiler = profiler or memory_profiler
+    if profiler is None:
+        return handler
+
+    from fast_path import route_of_event
+    from warm_up import is_warm_up_event
+
+    def wrapper(event, context):
+        if is_warm_up_event(event):
+            request_type = 'WarmUp'
+        else:
+            request_type, intent_name = route_of_event(event)
+            request_type = intent_name or request_type
+        started = profiler.begin()
+        try:
+            return handler(event, context)
+        finally:
+            profiler.finish(request_type, started)
+    return wrapper
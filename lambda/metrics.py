@@ -0,0 +1,44 @@
+import json
+import os
+import sys
+import time
+
+# CloudWatch namespace the Embedded Metric Format records are published to.
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'AXRRadio')
+
+# Set METRICS_ENABLED=false to silence all metric output, e.g. in local scripts.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+
+
+# Writes a single CloudWatch Embedded Metric Format record to stdout.
+#
+# Lambda forwards stdout to CloudWatch Logs, which extracts the metrics from
+# the record, so publishing a metric costs no extra network call.
+# metrics is a dict of name -> (value, unit), dimensions a dict of name -> str
+# and properties are extra, non-metric fields kept on the log record.
+def put_metrics(metrics, dimensions=None, properties=None, namespace=METRICS_NAMESPACE, stream=None):
+    if not METRICS_ENABLED or not metrics:
+        return None
+    dimensions = dimensions or {}
+    record = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': namespace,
+                'Dimensions': [sorted(dimensions.keys())],
+                'Metrics': [{'Name': name, 'Unit': unit} for name, (value, unit) in sorted(metrics.items())],
+            }],
+        },
+    }
+    if properties:
+        record.update(properties)
+    record.update(dimensions)
+    for name, (value, unit) in metrics.items():
+        record[name] = value
+    line = json.dumps(record, separators=(',', ':'), default=str)
+    (stream or sys.stdout).write(line + '\n')
+    return line
+
+
+def put_metric(name, value, unit='Count', dimensions=None, properties=None):
+    return put_metrics({name: (value, unit)}, dimensions=dimensions, properties=properties)
@@ -0,0 +1,122 @@
+import copy
+import logging
+import threading
+
+from collections import OrderedDict
+
+from ask_sdk_core.attributes_manager import AbstractPersistenceAdapter
+from ask_sdk_dynamodb.partition_keygen import user_id_partition_keygen
+
+from request_timing import (timed, PERSISTENCE_LOAD, PERSISTENCE_SAVE)
+from stream_catalog import (stream_catalog, DEFAULT_STREAM_KEY)
+
+logger = logging.getLogger(__name__)
+
+# Number of partition keys whose loaded attributes are remembered for dirty checking.
+# A Lambda container serves one request at a time, so this only needs to cover
+# the current request; the headroom is for the launch path's concurrent work.
+SNAPSHOT_CACHE_SIZE = 64
+
+# Persistent attribute referencing the user's stream by its catalog key:
+# {"version": 1, "key": "SG"}. The record itself is resolved against the
+# catalog at request time, so catalog edits apply without a data backfill.
+STREAM_ATTRIBUTE = 'stream'
+STREAM_ATTRIBUTE_VERSION = 1
+
+# Old format, a full copy of the catalog record. Migrated on read.
+LEGACY_STREAM_ATTRIBUTE = 'stream_data'
+
+
+# Persistence adapter that wraps the real adapter (DynamoDbAdapter) and makes it lazy and write-avoiding.
+#
+# The wrapped adapter is only built, via adapter_factory, the first time a
+# handler actually reads or writes persistent attributes. The SDK's
+# AttributesManager already defers get_attributes until
+# persistent_attributes is accessed, so handlers that never touch it (pause,
+# playback events, ...) don't cause any DynamoDB traffic or client setup.
+#
+# get_attributes keeps a deep copy of what was loaded and save_attributes
+# skips the write when the attributes to save are equal to it. The copy is
+# only trusted within the request that loaded it, another container may have
+# written the item in the meantime.
+class LazyPersistenceAdapter(AbstractPersistenceAdapter):
+
+    def __init__(self, adapter_factory, partition_keygen=user_id_partition_keygen):
+        self._adapter_factory = adapter_factory
+        self._partition_keygen = partition_keygen
+        self._adapter = None
+        self._lock = threading.Lock()
+        self._snapshots = OrderedDict()
+
+    @property
+    def adapter(self):
+        if self._adapter is None:
+            with self._lock:
+                if self._adapter is None:
+                    self._adapter = self._adapter_factory()
+        return self._adapter
+
+    def get_attributes(self, request_envelope):
+        with timed(PERSISTENCE_LOAD):
+            attributes = self.adapter.get_attributes(request_envelope=request_envelope)
+        self._remember(request_envelope, attributes)
+        return attributes
+
+    def save_attributes(self, request_envelope, attributes):
+        partition_key = self._partition_keygen(request_envelope)
+        with self._lock:
+            request_id, snapshot = self._snapshots.get(partition_key, (None, None))
+        if request_id == request_envelope.request.request_id and snapshot == attributes:
+            logger.debug("Persistent attributes unchanged, skipping save")
+            return
+        with timed(PERSISTENCE_SAVE):
+            self.adapter.save_attributes(request_envelope=request_envelope, attributes=attributes)
+        self._remember(request_envelope, attributes)
+
+    # Builds the wrapped adapter (and its DynamoDB resource, see clients.py).
+    def preload(self):
+        return self.adapter
+
+    def cache_state(self):
+        return {'loaded': self._adapter is not None, 'entries': len(self._snapshots), 'age_seconds': None, 'stale': False}
+
+    def delete_attributes(self, request_envelope):
+        self.adapter.delete_attributes(request_envelope=request_envelope)
+        with self._lock:
+            self._snapshots.pop(self._partition_keygen(request_envelope), None)
+
+    def _remember(self, request_envelope, attributes):
+        partition_key = self._partition_keygen(request_envelope)
+        snapshot = copy.deepcopy(attributes)
+        with self._lock:
+            self._snapshots[partition_key] = (request_envelope.request.request_id, snapshot)
+            self._snapshots.move_to_end(partition_key)
+            while len(self._snapshots) > SNAPSHOT_CACHE_SIZE:
+                self._snapshots.popitem(last=False)
+
+
+def set_persisted_stream_key(persistent_attributes, stream_key):
+    persistent_attributes[STREAM_ATTRIBUTE] = {'version': STREAM_ATTRIBUTE_VERSION, 'key': stream_key}
+    persistent_attributes.pop(LEGACY_STREAM_ATTRIBUTE, None)
+
+
+# Returns the catalog key of the user's stream, or None for a user that has none yet.
+#
+# Items still in the legacy format are migrated in place: the stored
+# stream_url is looked up in the catalog (falling back to the default stream
+# if the URL is gone) and the attributes are rewritten to the compact
+# reference. The caller saves the attributes as usual; the dirty tracking in
+# LazyPersistenceAdapter turns that into a no-op for already migrated items.
+def get_persisted_stream_key(persistent_attributes, catalog=stream_catalog):
+    stream_ref = persistent_attributes.get(STREAM_ATTRIBUTE)
+    if stream_ref:
+        return stream_ref.get('key')
+
+    legacy_stream_data = persistent_attributes.get(LEGACY_STREAM_ATTRIBUTE)
+    if legacy_stream_data is None:
+        return None
+
+    stream_key = catalog.key_for_url(legacy_stream_data.get('stream_url')) or DEFAULT_STREAM_KEY
+    logger.info("Migrating persisted stream_data to catalog key %s", stream_key)
+    set_persisted_stream_key(persistent_attributes, stream_key)
+    return stream_key
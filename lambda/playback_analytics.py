@@ -0,0 +1,223 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from collections import deque
+
+from clients import (client_registry, DYNAMODB)
+from directives import parse_stream_token
+from metrics import put_metrics
+from structured_logging import fingerprint
+
+logger = logging.getLogger(__name__)
+
+# Where playback records go: a DynamoDB table, or a newline-delimited JSON
+# file (e.g. for a local stand-in). Without either, nothing is recorded.
+PLAYBACK_ANALYTICS_TABLE = os.environ.get('PLAYBACK_ANALYTICS_TABLE')
+PLAYBACK_ANALYTICS_FILE = os.environ.get('PLAYBACK_ANALYTICS_FILE')
+
+# Records per write, seconds between two flushes of whatever is buffered, and
+# records waiting to be written at most (the oldest are dropped beyond that).
+PLAYBACK_ANALYTICS_BATCH_SIZE = int(os.environ.get('PLAYBACK_ANALYTICS_BATCH_SIZE', '25'))
+PLAYBACK_ANALYTICS_FLUSH_INTERVAL = float(os.environ.get('PLAYBACK_ANALYTICS_FLUSH_INTERVAL_SECONDS', '5'))
+PLAYBACK_ANALYTICS_MAX_BUFFER = int(os.environ.get('PLAYBACK_ANALYTICS_MAX_BUFFER', '1000'))
+
+# batch_write_item accepts at most 25 put requests.
+DYNAMODB_MAX_BATCH_SIZE = 25
+DYNAMODB_MAX_RETRIES = 3
+
+STARTED = 'started'
+STOPPED = 'stopped'
+FAILED = 'failed'
+
+
+# Writes record batches with DynamoDB's batch_write_item, retrying unprocessed items.
+#
+# Items are keyed by the device fingerprint and a time-ordered sort key.
+class DynamoDbAnalyticsSink(object):
+
+    def __init__(self, table_name, client_factory=None, max_retries=DYNAMODB_MAX_RETRIES):
+        self.table_name = table_name
+        self.max_retries = max_retries
+        self._client_factory = client_factory or _create_dynamodb_client
+        self._client = None
+        self._serializer = None
+
+    def write(self, records):
+        if self._client is None:
+            from boto3.dynamodb.types import TypeSerializer
+
+            self._client = self._client_factory()
+            self._serializer = TypeSerializer()
+        for start in range(0, len(records), DYNAMODB_MAX_BATCH_SIZE):
+            self._write_batch(records[start:start + DYNAMODB_MAX_BATCH_SIZE])
+
+    def _write_batch(self, records):
+        request_items = {self.table_name: [{'PutRequest': {'Item': self._item(record)}} for record in records]}
+        for attempt in range(self.max_retries + 1):
+            response = self._client.batch_write_item(RequestItems=request_items)
+            request_items = response.get('UnprocessedItems') or {}
+            if not request_items:
+                return
+            time.sleep(0.05 * 2 ** attempt)
+        logger.warning("Dropping %s unprocessed playback records",
+                       sum(len(items) for items in request_items.values()))
+
+    def _item(self, record):
+        item = dict(record, pk=record['device'], sk='{}#{}'.format(record['timestamp'], record['event']))
+        return dict((key, self._serializer.serialize(value)) for key, value in item.items() if value is not None)
+
+
+# The low-level client of the persistence adapter's resource, sharing its connection pool.
+def _create_dynamodb_client():
+    return client_registry.get(DYNAMODB).meta.client
+
+
+# Appends record batches as newline-delimited JSON to a file.
+class NdjsonAnalyticsSink(object):
+
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, records):
+        lines = ''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in records)
+        with open(self.path, 'a') as analytics_file:
+            analytics_file.write(lines)
+
+
+def create_sink():
+    if PLAYBACK_ANALYTICS_TABLE:
+        return DynamoDbAnalyticsSink(PLAYBACK_ANALYTICS_TABLE)
+    if PLAYBACK_ANALYTICS_FILE:
+        return NdjsonAnalyticsSink(PLAYBACK_ANALYTICS_FILE)
+    return None
+
+
+# Buffers playback records and writes them to a sink in batches from a background thread.
+#
+# record() only appends to an in-memory buffer, so the AudioPlayer event
+# handlers never wait on a write. A daemon thread, started with the first
+# record, writes batches of up to BATCH_SIZE records as soon as a full one
+# is waiting, and whatever is buffered every FLUSH_INTERVAL seconds.
+#
+# The thread is frozen along with the container between invocations, so its
+# timer alone doesn't bound how long a record waits: a container seeing few
+# events rarely runs for FLUSH_INTERVAL seconds in a row. record() therefore
+# also wakes the thread up once the oldest buffered record is FLUSH_INTERVAL
+# seconds old, and the write runs while that invocation is being answered.
+# Records still buffered when a container is retired are lost.
+#
+# Listening time is summed per stream from the offsets of stopped and failed
+# playbacks (for a live stream, the time it played) and published as the
+# ListeningMinutes metric with every batch.
+class PlaybackAnalytics(object):
+
+    def __init__(self, sink=None, batch_size=PLAYBACK_ANALYTICS_BATCH_SIZE,
+                 flush_interval=PLAYBACK_ANALYTICS_FLUSH_INTERVAL, max_buffer=PLAYBACK_ANALYTICS_MAX_BUFFER,
+                 clock=time.time):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.clock = clock
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._buffer = deque()
+        self._listening_ms = {}
+        self._pending_listening_ms = {}
+        self._thread = None
+
+    @property
+    def enabled(self):
+        return self.sink is not None
+
+    def record(self, event, device_id, token, offset_ms=None, error_type=None):
+        if self.sink is None:
+            return
+        stream_key, mirror_index, _ = parse_stream_token(token)
+        record = {
+            'event': event,
+            'device': fingerprint(device_id),
+            'stream': stream_key,
+            'mirror': mirror_index if stream_key is not None else None,
+            'offset_ms': offset_ms,
+            'error': error_type,
+            'timestamp': int(self.clock() * 1000),
+        }
+        with self._lock:
+            if len(self._buffer) >= self.max_buffer:
+                self._buffer.popleft()
+                self.dropped += 1
+            self._buffer.append(record)
+            if event in (STOPPED, FAILED) and offset_ms:
+                self._pending_listening_ms[stream_key] = self._pending_listening_ms.get(stream_key, 0) + offset_ms
+            due = (len(self._buffer) >= self.batch_size or
+                   record['timestamp'] - self._buffer[0]['timestamp'] >= self.flush_interval * 1000)
+        self._ensure_thread()
+        if due:
+            self._wakeup.set()
+
+    # Total listening minutes per stream recorded by this container.
+    def listening_minutes(self):
+        with self._lock:
+            totals = dict(self._listening_ms)
+            for stream_key, listening_ms in self._pending_listening_ms.items():
+                totals[stream_key] = totals.get(stream_key, 0) + listening_ms
+        return dict((stream_key, listening_ms / 60000.0) for stream_key, listening_ms in totals.items())
+
+    # Writes out everything buffered, on the calling thread. Returns the number of records written.
+    def flush(self):
+        written = 0
+        while True:
+            with self._lock:
+                batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+                listening_ms, self._pending_listening_ms = self._pending_listening_ms, {}
+                dropped, self.dropped = self.dropped, 0
+            self._publish(listening_ms, dropped)
+            if not batch:
+                return written
+            try:
+                self.sink.write(batch)
+                written += len(batch)
+            except Exception as e:
+                logger.error("Unable to write %s playback records: %s", len(batch), e)
+
+    def _publish(self, listening_ms, dropped):
+        for stream_key, stream_listening_ms in listening_ms.items():
+            with self._lock:
+                self._listening_ms[stream_key] = self._listening_ms.get(stream_key, 0) + stream_listening_ms
+            put_metrics({'ListeningMinutes': (stream_listening_ms / 60000.0, 'None')},
+                        dimensions={'Stream': str(stream_key)})
+        if dropped:
+            put_metrics({'PlaybackRecordsDropped': (dropped, 'Count')})
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='playback-analytics')
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+playback_analytics = PlaybackAnalytics(create_sink())
+
+
+# Records an AudioPlayer event from the raw request envelope, for requests
+# answered by the static fast path.
+def record_playback_event(event_type, event, analytics=playback_analytics):
+    if not analytics.enabled:
+        return
+    request = event.get('request') or {}
+    device = ((event.get('context') or {}).get('System') or {}).get('device') or {}
+    analytics.record(event_type, device.get('deviceId'), request.get('token'), request.get('offsetInMilliseconds'))
@@ -0,0 +1,179 @@
+import json
+import os
+import random
+import threading
+import time
+
+from contextlib import contextmanager
+
+from ask_sdk_core.dispatch_components import (AbstractRequestInterceptor, AbstractResponseInterceptor)
+from ask_sdk_core.skill import CustomSkill
+from ask_sdk_model import RequestEnvelope
+
+import metrics
+
+from fast_path import route_of_event
+from warm_up import is_warm_up_event
+
+# Fraction of invocations (0 to 1) whose phase timings are emitted.
+REQUEST_TIMING_SAMPLE_RATE = float(os.environ.get('REQUEST_TIMING_SAMPLE_RATE', '1'))
+
+# Request phases. Handler covers the request handler only, the persistence
+# and address calls it makes are reported both on their own and within it.
+DESERIALIZE = 'Deserialize'
+LOCALIZATION = 'Localization'
+PERSISTENCE_LOAD = 'PersistenceLoad'
+PERSISTENCE_SAVE = 'PersistenceSave'
+ADDRESS_API = 'AddressApi'
+HANDLER = 'Handler'
+SERIALIZE = 'Serialize'
+TOTAL = 'Total'
+
+
+# Collects the phase timings of the invocation in flight and emits them as one EMF record.
+#
+# A Lambda container handles one invocation at a time, so a single module
+# level timer is enough. Phases may be recorded from worker threads of the
+# current invocation, hence the lock. When the invocation isn't sampled the
+# timer stays inactive and timed() costs next to nothing.
+class RequestTimer(object):
+
+    def __init__(self, sample_rate=REQUEST_TIMING_SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self._lock = threading.Lock()
+        self._active = False
+        self._phases = {}
+        self._marks = {}
+        self._dimensions = {}
+        self._properties = {}
+        self._started = None
+
+    @property
+    def active(self):
+        return self._active
+
+    def begin(self, request_type, request_id=None):
+        if not metrics.METRICS_ENABLED or self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            self._active = False
+            return False
+        with self._lock:
+            self._phases = {}
+            self._marks = {}
+            self._dimensions = {'RequestType': request_type or 'Unknown'}
+            self._properties = {'RequestId': request_id, 'SampleRate': self.sample_rate}
+            self._started = time.perf_counter()
+            self._active = True
+        return True
+
+    def record(self, phase, seconds):
+        if not self._active:
+            return
+        with self._lock:
+            self._phases[phase] = self._phases.get(phase, 0.0) + seconds
+
+    def start(self, phase):
+        if self._active:
+            self._marks[phase] = time.perf_counter()
+
+    def stop(self, phase):
+        started = self._marks.pop(phase, None) if self._active else None
+        if started is not None:
+            self.record(phase, time.perf_counter() - started)
+
+    def finish(self, **properties):
+        if not self._active:
+            return None
+        with self._lock:
+            self._active = False
+            phases = dict(self._phases)
+            phases[TOTAL] = time.perf_counter() - self._started
+            self._properties.update(properties)
+            return metrics.put_metrics(
+                dict((phase + 'Time', (seconds * 1000.0, 'Milliseconds')) for phase, seconds in phases.items()),
+                dimensions=self._dimensions,
+                properties=self._properties)
+
+
+request_timer = RequestTimer()
+
+
+@contextmanager
+def _timed(phase, timer):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.record(phase, time.perf_counter() - started)
+
+
+class _NotTimed(object):
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NOT_TIMED = _NotTimed()
+
+
+# Context manager adding the time spent in its block to the given phase.
+def timed(phase, timer=request_timer):
+    if not timer.active:
+        return _NOT_TIMED
+    return _timed(phase, timer)
+
+
+# Lambda entry point equivalent to CustomSkillBuilder.lambda_handler() that
+# also times envelope deserialization and serialization. The invocation
+# itself is timed by timed_invocation.
+def timed_lambda_handler(skill_builder, timer=request_timer):
+    def wrapper(event, context):
+        skill = CustomSkill(skill_configuration=skill_builder.skill_configuration)
+        with timed(DESERIALIZE, timer):
+            request_envelope = skill.serializer.deserialize(payload=json.dumps(event), obj_type=RequestEnvelope)
+        response_envelope = skill.invoke(request_envelope=request_envelope, context=context)
+        with timed(SERIALIZE, timer):
+            return skill.serializer.serialize(response_envelope)
+    return wrapper
+
+
+# Wraps the outermost Lambda entry point, so that every invocation emits a
+# TotalTime record with its RequestType dimension, whichever path answers
+# it: the SDK, the static response fast path or a warm-up ("WarmUp"). The
+# phases recorded along the way (only the SDK path has any) go in the same
+# record.
+def timed_invocation(handler, timer=request_timer):
+    def wrapper(event, context):
+        if is_warm_up_event(event):
+            timer.begin('WarmUp')
+        else:
+            request_type, intent_name = route_of_event(event)
+            timer.begin(intent_name or request_type, (event.get('request') or {}).get('requestId'))
+        try:
+            return handler(event, context)
+        finally:
+            timer.finish()
+    return wrapper
+
+
+# Register last among the request interceptors, together with
+# HandlerTimingResponseInterceptor as the first response interceptor, to time
+# the request handler alone.
+class HandlerTimingRequestInterceptor(AbstractRequestInterceptor):
+
+    def __init__(self, timer=request_timer):
+        self.timer = timer
+
+    def process(self, handler_input):
+        self.timer.start(HANDLER)
+
+
+class HandlerTimingResponseInterceptor(AbstractResponseInterceptor):
+
+    def __init__(self, timer=request_timer):
+        self.timer = timer
+
+    def process(self, handler_input, response):
+        self.timer.stop(HANDLER)
@@ -0,0 +1,221 @@
+import math
+import re
+import threading
+import time
+import unicodedata
+
+from stream_catalog import stream_catalog
+
+# Optional catalog fields describing a station: the name it is announced
+# and asked for by, other names users say, and where it broadcasts.
+STATION_NAME_FIELD = 'station_name'
+ALIASES_FIELD = 'aliases'
+REGION_FIELD = 'region'
+COUNTRY_CODE_FIELD = 'country_code'
+
+# Lowest score (0 to 1, see StationIndex.lookup) a station needs to be picked.
+MIN_MATCH_SCORE = 0.5
+
+# A spoken word only fuzzily matches a known word this similar to it (Dice
+# coefficient of their trigrams), and only words this long are fuzzily matched.
+MIN_FUZZY_SIMILARITY = 0.5
+MIN_FUZZY_TOKEN_LENGTH = 4
+MAX_FUZZY_CANDIDATES = 3
+
+# Names a single spoken word brings in as candidates at most, the lightest
+# (i.e. shortest, best scoring) ones first.
+MAX_CANDIDATE_NAMES = 256
+
+_NON_ALPHANUMERIC = re.compile(r'[^0-9a-z]+')
+
+
+# Lower case, accents stripped, punctuation turned into spaces:
+# "Radio Café-Asia!" -> "radio cafe asia".
+def normalize_name(name):
+    name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii')
+    return _NON_ALPHANUMERIC.sub(' ', name.lower()).strip()
+
+
+# The name a station is announced by.
+def station_name(stream_data):
+    return stream_data.get(STATION_NAME_FIELD) or stream_data['stream_subtitle']
+
+
+# Every name a station can be asked for by: its station name and its aliases.
+def station_names(stream_data):
+    return [station_name(stream_data)] + list(stream_data.get(ALIASES_FIELD) or ())
+
+
+def _trigrams(token):
+    padded = ' {} '.format(token)
+    return set(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+# Spoken name -> catalog key index over every name of every station.
+#
+# Built once from the catalog: exact normalized names go in a dict, and
+# every word of every name in an inverted index (word -> names). Words are
+# weighted by their inverse document frequency, so "radio", which most
+# names contain, counts for little and "singapore" for a lot. Words the
+# index doesn't know (ASR misspellings) are matched to known words through a
+# trigram index. A lookup only touches the names sharing a word with the
+# spoken one; it never scans the catalog.
+class StationIndex(object):
+
+    def __init__(self, entries):
+        self._exact = {}
+        self._names = []
+        postings = {}
+        for key in sorted(entries):
+            for name in station_names(entries[key]):
+                normalized = normalize_name(name)
+                if not normalized:
+                    continue
+                self._exact.setdefault(normalized, key)
+                tokens = frozenset(normalized.split())
+                for token in tokens:
+                    postings.setdefault(token, []).append(len(self._names))
+                self._names.append((key, tokens, len(normalized)))
+
+        self._weights = dict(
+            (token, math.log(1.0 + float(len(self._names)) / len(name_ids)))
+            for token, name_ids in postings.items())
+        self._name_weights = [sum(self._weights[token] for token in tokens) for _, tokens, _ in self._names]
+        self._postings = dict(
+            (token, tuple(sorted(name_ids, key=lambda name_id: self._name_weights[name_id])))
+            for token, name_ids in postings.items())
+        self._unknown_weight = math.log(1.0 + len(self._names))
+        self._trigram_index = {}
+        self._trigram_counts = {}
+        for token in self._postings:
+            if len(token) >= MIN_FUZZY_TOKEN_LENGTH:
+                trigrams = _trigrams(token)
+                self._trigram_counts[token] = len(trigrams)
+                for trigram in trigrams:
+                    self._trigram_index.setdefault(trigram, []).append(token)
+
+    def __len__(self):
+        return len(self._names)
+
+    # Catalog key of the station best matching a spoken name, None if none matches well enough.
+    #
+    # A name is scored by the weight of the words it shares with the spoken
+    # name over the weight of the words of both (a weighted Jaccard index),
+    # fuzzily matched words counting for their similarity. The score of a
+    # name can't exceed the weight of the spoken words it contains over the
+    # total weight of the spoken words, so the most common spoken words
+    # (up to min_score of the total) aren't used to find candidate names:
+    # a name only matching those can't score high enough. This keeps
+    # "radio" from pulling in every station, and a spoken name made of
+    # common words only brings in the MAX_CANDIDATE_NAMES lightest names
+    # containing each of them.
+    def lookup(self, spoken_name, min_score=MIN_MATCH_SCORE):
+        normalized = normalize_name(spoken_name or '')
+        if not normalized:
+            return None
+        key = self._exact.get(normalized)
+        if key is not None:
+            return key
+
+        spoken = []
+        spoken_weight = 0.0
+        for token in set(normalized.split()):
+            if token in self._postings:
+                candidates = [(token, self._weights[token])]
+            else:
+                candidates = [(candidate, self._weights[candidate] * similarity)
+                              for candidate, similarity in self._fuzzy_candidates(token)]
+            spoken_weight += self._weights[candidates[0][0]] if candidates else self._unknown_weight
+            if candidates:
+                spoken.append((max(weight for _, weight in candidates), candidates))
+        spoken.sort(key=lambda entry: entry[0])
+
+        skipped_weight = 0.0
+        name_ids = set()
+        for max_weight, candidates in spoken:
+            if skipped_weight + max_weight < min_score * spoken_weight:
+                skipped_weight += max_weight
+                continue
+            for candidate, _ in candidates:
+                name_ids.update(self._postings[candidate][:MAX_CANDIDATE_NAMES])
+
+        best = None
+        for name_id in name_ids:
+            key, tokens, length = self._names[name_id]
+            matched = 0.0
+            for _, candidates in spoken:
+                matched += max([weight for candidate, weight in candidates if candidate in tokens] or [0.0])
+            score = matched / (spoken_weight + self._name_weights[name_id] - matched)
+            if score >= min_score and (best is None or (score, -length) > best[0]):
+                best = ((score, -length), key)
+        return best[1] if best is not None else None
+
+    def _fuzzy_candidates(self, token):
+        if len(token) < MIN_FUZZY_TOKEN_LENGTH:
+            return []
+        trigrams = _trigrams(token)
+        shared = {}
+        for trigram in trigrams:
+            for candidate in self._trigram_index.get(trigram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+        candidates = []
+        for candidate, count in shared.items():
+            similarity = 2.0 * count / (len(trigrams) + self._trigram_counts[candidate])
+            if similarity >= MIN_FUZZY_SIMILARITY:
+                candidates.append((candidate, similarity))
+        candidates.sort(key=lambda candidate: -candidate[1])
+        return candidates[:MAX_FUZZY_CANDIDATES]
+
+
+# StationIndex of the stream catalog, built on first lookup and rebuilt when the catalog changes.
+class StationDirectory(object):
+
+    def __init__(self, catalog=stream_catalog):
+        self.catalog = catalog
+        self._lock = threading.Lock()
+        self._catalog_version = None
+        self._index = None
+        self._built_at = None
+
+    @property
+    def index(self):
+        catalog_version = self.catalog.version
+        if catalog_version != self._catalog_version:
+            with self._lock:
+                if catalog_version != self._catalog_version:
+                    self._index = StationIndex(dict((key, self.catalog.get(key)) for key in self.catalog.keys()))
+                    self._catalog_version = catalog_version
+                    self._built_at = time.time()
+        return self._index
+
+    def preload(self):
+        return self.index
+
+    # The index is stale once the catalog it was built from changed.
+    def cache_state(self):
+        return {
+            'loaded': self._index is not None,
+            'entries': len(self._index) if self._index is not None else 0,
+            'age_seconds': time.time() - self._built_at if self._built_at is not None else None,
+            'stale': self._catalog_version != self.catalog.version,
+        }
+
+    def lookup(self, spoken_name):
+        return self.index.lookup(spoken_name)
+
+    # Catalog key of the station a slot refers to. Entity resolution ids of
+    # the slot type are catalog keys, a value Alexa resolved is taken as is;
+    # otherwise the spoken value is looked up in the index.
+    def resolve_slot(self, slot):
+        if slot is None:
+            return None
+        resolutions = slot.resolutions.resolutions_per_authority if slot.resolutions is not None else None
+        for resolution in resolutions or ():
+            if resolution.status is not None and resolution.status.code.value == 'ER_SUCCESS_MATCH':
+                for value in resolution.values or ():
+                    if value.value.id in self.catalog:
+                        return value.value.id
+        return self.lookup(slot.value)
+
+
+station_directory = StationDirectory()
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from types import MappingProxyType
+
+from asset_bundle import load_asset_bundle
+
+logger = logging.getLogger(__name__)
+
+# The catalog lives next to this module so the lookup works regardless of the
+# working directory the Lambda runtime (or a local script) was started from.
+STREAM_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stream_db.json')
+
+# Key of the catalog entry that is played when no country specific stream exists.
+DEFAULT_STREAM_KEY = 'default'
+
+# Optional field of a catalog entry: URLs of the same stream to fail over to,
+# in order of preference, after stream_url.
+MIRRORS_FIELD = 'mirrors'
+
+# Minimum number of seconds between two stat() calls on the catalog file.
+# A warm container serves many requests per second, there is no need to
+# hit the file system on every one of them to detect a redeploy.
+RELOAD_CHECK_INTERVAL = float(os.environ.get('STREAM_CATALOG_RELOAD_CHECK_INTERVAL', '5'))
+
+
+# Process-lifetime, read-only view of stream_db.json.
+#
+# The file is parsed once per container and indexed by country code. On
+# lookup the file's mtime is checked (at most every RELOAD_CHECK_INTERVAL
+# seconds) and the catalog is only re-parsed when the mtime changed *and* the
+# content hash differs from the one that is currently loaded. Records are
+# handed out as MappingProxyType instances so a handler can't accidentally
+# mutate the shared copy.
+#
+# With an asset bundle the initial catalog is the one compiled into it, so a
+# cold start doesn't parse stream_db.json. The first check then hashes the
+# file as usual and only re-parses it if it no longer matches the bundle.
+class StreamCatalog(object):
+
+    def __init__(self, path=STREAM_DB_PATH, check_interval=RELOAD_CHECK_INTERVAL, bundle=None):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._keys_by_url = {}
+        self._mtime = None
+        self._digest = None
+        self._loaded_at = None
+        self._next_check = 0.0
+        if bundle is not None and 'stream_db' in bundle:
+            self._install(bundle['stream_db'], bundle['stream_db_sha1'])
+            self._next_check = time.time() + self.check_interval
+
+    @property
+    def version(self):
+        self._ensure_fresh()
+        return self._digest
+
+    def get(self, country_code):
+        self._ensure_fresh()
+        if country_code is None:
+            return None
+        return self._entries.get(country_code)
+
+    # Reverse lookup of the catalog key whose stream_url, or one of its mirrors, is the given URL.
+    def key_for_url(self, stream_url):
+        self._ensure_fresh()
+        return self._keys_by_url.get(stream_url)
+
+    def keys(self):
+        self._ensure_fresh()
+        return list(self._entries.keys())
+
+    def __contains__(self, country_code):
+        self._ensure_fresh()
+        return country_code in self._entries
+
+    def __len__(self):
+        self._ensure_fresh()
+        return len(self._entries)
+
+    # Checks the file for changes right away, whatever the check interval.
+    def preload(self):
+        with self._lock:
+            self._next_check = time.time() + self.check_interval
+            self._load()
+
+    # What is loaded, how long ago, and whether a check for a changed file is due.
+    def cache_state(self):
+        now = time.time()
+        return {
+            'loaded': self._digest is not None,
+            'entries': len(self._entries),
+            'version': self._digest[:12] if self._digest is not None else None,
+            'age_seconds': now - self._loaded_at if self._loaded_at is not None else None,
+            'stale': self._digest is None or now >= self._next_check,
+        }
+
+    def _ensure_fresh(self):
+        now = time.time()
+        if self._digest is not None and now < self._next_check:
+            return
+        with self._lock:
+            if self._digest is not None and now < self._next_check:
+                return
+            self._next_check = now + self.check_interval
+            self._load()
+
+    def _load(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError as e:
+            if self._digest is None:
+                raise
+            # Keep serving the last good copy if the file disappears mid-flight.
+            logger.error("Unable to stat stream catalog %s: %s", self.path, e)
+            return
+
+        if mtime == self._mtime:
+            return
+
+        with open(self.path, 'rb') as stream_db_file:
+            raw = stream_db_file.read()
+        digest = hashlib.sha1(raw).hexdigest()
+        self._mtime = mtime
+        if digest == self._digest:
+            return
+
+        self._install(json.loads(raw.decode('utf-8')), digest)
+
+    def _install(self, stream_db, digest):
+        self._entries = dict(
+            (country_code, _freeze(stream_data))
+            for country_code, stream_data in stream_db.items())
+        self._keys_by_url = {}
+        for country_code, stream_data in self._entries.items():
+            for stream_url in stream_urls(stream_data):
+                self._keys_by_url.setdefault(stream_url, country_code)
+        self._digest = digest
+        self._loaded_at = time.time()
+        logger.info("Loaded %d stream catalog entries (version %s)", len(self._entries), digest[:12])
+
+
+def _freeze(stream_data):
+    stream_data = dict(
+        (field, tuple(value) if isinstance(value, list) else value) for field, value in stream_data.items())
+    stream_data[MIRRORS_FIELD] = tuple(stream_data.get(MIRRORS_FIELD) or ())
+    return MappingProxyType(stream_data)
+
+
+# All URLs a catalog entry can be played from: stream_url first, then its mirrors.
+def stream_urls(stream_data):
+    return (stream_data['stream_url'],) + tuple(
+        url for url in stream_data.get(MIRRORS_FIELD, ()) if url != stream_data['stream_url'])
+
+
+stream_catalog = StreamCatalog(bundle=load_asset_bundle())
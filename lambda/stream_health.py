@@ -0,0 +1,224 @@
+import logging
+import os
+import threading
+import time
+
+from concurrent.futures import wait
+
+from io_pool import IoPool
+from metrics import put_metric
+
+logger = logging.getLogger(__name__)
+
+# How long the result of a successful probe (or a reported successful playback) is trusted.
+STREAM_HEALTH_TTL = float(os.environ.get('STREAM_HEALTH_TTL_SECONDS', '60'))
+
+# A failing URL is avoided for BASE * 2^(consecutive failures - 1) seconds, at most MAX.
+STREAM_FAILURE_BACKOFF_BASE = float(os.environ.get('STREAM_FAILURE_BACKOFF_BASE_SECONDS', '5'))
+STREAM_FAILURE_BACKOFF_MAX = float(os.environ.get('STREAM_FAILURE_BACKOFF_MAX_SECONDS', '300'))
+
+# Timeout of a single probe, and how long a request waits for a round of probes.
+STREAM_PROBE_TIMEOUT = float(os.environ.get('STREAM_PROBE_TIMEOUT_SECONDS', '1.5'))
+STREAM_PROBE_DEADLINE = float(os.environ.get('STREAM_PROBE_DEADLINE_SECONDS', '2'))
+
+# Probes run on their own pool, so a round of slow probes can't hold up other I/O.
+STREAM_PROBE_POOL_SIZE = int(os.environ.get('STREAM_PROBE_POOL_SIZE', '4'))
+
+# Failovers in a row before giving up on a playback. The count starts over
+# once a mirror played for STREAM_FAILOVER_RESET_AFTER seconds before failing.
+STREAM_FAILOVER_MAX_ATTEMPTS = int(os.environ.get('STREAM_FAILOVER_MAX_ATTEMPTS', '3'))
+STREAM_FAILOVER_RESET_AFTER = float(os.environ.get('STREAM_FAILOVER_RESET_AFTER_SECONDS', '60'))
+
+
+# Returns True if the stream at url answers with a non-error status.
+#
+# Live streams never end, so only the status line and headers are read before
+# the connection is closed. GET is used since many stream servers don't
+# implement HEAD.
+def probe_stream(url, timeout=STREAM_PROBE_TIMEOUT):
+    from http.client import BadStatusLine
+    from urllib.request import (Request, urlopen)
+
+    request = Request(url, headers={'User-Agent': 'AXRRadio-HealthCheck/1.0', 'Icy-MetaData': '0'})
+    try:
+        response = urlopen(request, timeout=timeout)
+    except BadStatusLine as e:
+        # SHOUTcast v1 servers answer "ICY 200 OK", which http.client refuses.
+        return str(e.line).startswith('ICY 200')
+    except Exception as e:
+        logger.info("Stream probe of %s failed: %s", url, e)
+        return False
+    try:
+        return response.status < 400
+    finally:
+        response.close()
+
+
+# Per URL health record.
+class StreamHealth(object):
+
+    def __init__(self):
+        self.failures = 0
+        self.checked_at = None
+        self.healthy = None
+        self.retry_at = 0.0
+
+
+# Recent probe and playback results per stream URL.
+#
+# A failure (failed probe or AudioPlayer.PlaybackFailed) puts the URL in
+# exponential backoff, during which it is only picked when every other
+# mirror is in backoff too. A success clears the failure count. Health is
+# kept per container, every container learns about an outage on its own.
+class StreamHealthCache(object):
+
+    def __init__(self, ttl=STREAM_HEALTH_TTL, backoff_base=STREAM_FAILURE_BACKOFF_BASE,
+                 backoff_max=STREAM_FAILURE_BACKOFF_MAX, clock=time.time):
+        self.ttl = ttl
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._health = {}
+
+    def record_success(self, url):
+        with self._lock:
+            health = self._health.setdefault(url, StreamHealth())
+            health.failures = 0
+            health.healthy = True
+            health.checked_at = self.clock()
+            health.retry_at = 0.0
+
+    def record_failure(self, url):
+        with self._lock:
+            health = self._health.setdefault(url, StreamHealth())
+            health.failures += 1
+            health.healthy = False
+            health.checked_at = self.clock()
+            backoff = min(self.backoff_base * 2 ** (health.failures - 1), self.backoff_max)
+            health.retry_at = health.checked_at + backoff
+            return health.failures
+
+    # False while the URL is in backoff after a failure.
+    def is_available(self, url):
+        health = self._health.get(url)
+        return health is None or self.clock() >= health.retry_at
+
+    # True when the URL has no recent result, healthy or not, to go by.
+    def needs_probe(self, url):
+        health = self._health.get(url)
+        if health is None or health.checked_at is None:
+            return True
+        if not health.healthy:
+            return self.clock() >= health.retry_at
+        return self.clock() - health.checked_at >= self.ttl
+
+    def retry_at(self, url):
+        health = self._health.get(url)
+        return health.retry_at if health is not None else 0.0
+
+    def failures(self, url):
+        health = self._health.get(url)
+        return health.failures if health is not None else 0
+
+    def clear(self):
+        with self._lock:
+            self._health = {}
+
+
+stream_health = StreamHealthCache()
+
+
+# Probes stream URLs concurrently on a bounded pool and records the results in a StreamHealthCache.
+class StreamProber(object):
+
+    def __init__(self, health=stream_health, pool=None, probe=probe_stream, timeout=STREAM_PROBE_TIMEOUT):
+        self.health = health
+        self.pool = pool or IoPool(max_workers=STREAM_PROBE_POOL_SIZE)
+        self.probe = probe
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._in_flight = {}
+
+    # Probes the given URLs that have no recent result and waits up to deadline
+    # seconds for them. Probes still running then complete in the background.
+    def probe_all(self, urls, deadline=STREAM_PROBE_DEADLINE):
+        futures = [self._submit(url) for url in urls if self.health.needs_probe(url)]
+        if futures:
+            wait(futures, timeout=deadline)
+
+    def _submit(self, url):
+        with self._lock:
+            future = self._in_flight.get(url)
+            if future is None:
+                future = self.pool.submit(self._probe, url)
+                self._in_flight[url] = future
+            return future
+
+    def _probe(self, url):
+        try:
+            if self.probe(url, timeout=self.timeout):
+                self.health.record_success(url)
+            else:
+                self.health.record_failure(url)
+        finally:
+            with self._lock:
+                self._in_flight.pop(url, None)
+
+
+stream_prober = StreamProber()
+
+
+# Index of the mirror to play, given the catalog entry's ordered URLs.
+#
+# The first URL, in order, that isn't in backoff wins. If all of them are,
+# the one whose backoff ends first is the best bet. skip is the index of the
+# URL that just failed: it is only picked if it's the only one, and the
+# search starts at the mirror after it (wrapping around).
+def choose_mirror(urls, health=stream_health, skip=None):
+    start = 0 if skip is None else skip + 1
+    candidates = [
+        index % len(urls) for index in range(start, start + len(urls)) if index % len(urls) != skip]
+    candidates = candidates or list(range(len(urls)))
+    for index in candidates:
+        if health.is_available(urls[index]):
+            return index
+    return min(candidates, key=lambda index: health.retry_at(urls[index]))
+
+
+# Handles a failed playback of urls[failed_index], the attempt-th failover in a row.
+#
+# The URL is put in backoff, the other mirrors without a recent result are
+# probed concurrently, and (stream key, mirror index, attempt) of what to
+# play next is returned. Once every mirror of the stream is in backoff (or
+# it has no other), the fallback stream (the catalog's default) is played
+# from its first mirror that isn't, if any. None means the retries are used
+# up and playback should stop.
+def fail_over(stream_key, urls, failed_index, attempt, played_ms=0, fallback_key=None, fallback_urls=(),
+              health=stream_health, prober=stream_prober, max_attempts=STREAM_FAILOVER_MAX_ATTEMPTS,
+              reset_after=STREAM_FAILOVER_RESET_AFTER):
+    if not 0 <= failed_index < len(urls):
+        # The catalog changed since the directive was issued.
+        failed_index = 0
+    failures = health.record_failure(urls[failed_index])
+    if played_ms >= reset_after * 1000:
+        attempt = 0
+    if attempt >= max_attempts:
+        logger.warning("Giving up on stream %s after %s failovers", stream_key, attempt)
+        put_metric('StreamFailoverExhausted', 1, dimensions={'Stream': stream_key})
+        return None
+    # The fallback is probed in the same round, a second one would double the wait.
+    prober.probe_all([url for index, url in enumerate(urls) if index != failed_index] + list(fallback_urls))
+    mirror_index = choose_mirror(urls, health, skip=failed_index)
+    if fallback_urls and (mirror_index == failed_index or not health.is_available(urls[mirror_index])):
+        fallback_index = choose_mirror(fallback_urls, health)
+        if health.is_available(fallback_urls[fallback_index]):
+            logger.warning("Stream %s failed on mirror %s (%s failures) with no other mirror up, "
+                           "falling back to stream %s mirror %s",
+                           stream_key, failed_index, failures, fallback_key, fallback_index)
+            put_metric('StreamFallback', 1, dimensions={'Stream': stream_key})
+            return fallback_key, fallback_index, attempt + 1
+    logger.warning("Stream %s failed on mirror %s (%s failures), failing over to mirror %s",
+                   stream_key, failed_index, failures, mirror_index)
+    put_metric('StreamFailover', 1, dimensions={'Stream': stream_key})
+    return stream_key, mirror_index, attempt + 1
@@ -0,0 +1,142 @@
+import logging
+import os
+import threading
+import time
+
+from io_pool import IoPool
+
+logger = logging.getLogger(__name__)
+
+# Set STREAM_URL_RESOLUTION=true to play resolved URLs instead of the catalog ones.
+STREAM_URL_RESOLUTION = os.environ.get('STREAM_URL_RESOLUTION', 'false').lower() in ('1', 'true', 'yes')
+
+# How long a resolved URL is used before it is resolved again (in the background).
+STREAM_RESOLVER_TTL = float(os.environ.get('STREAM_RESOLVER_TTL_SECONDS', '300'))
+STREAM_RESOLVER_TIMEOUT = float(os.environ.get('STREAM_RESOLVER_TIMEOUT_SECONDS', '3'))
+
+# Nested playlists followed at most, and bytes read from a playlist.
+MAX_PLAYLIST_DEPTH = 3
+MAX_PLAYLIST_SIZE = 64 * 1024
+
+PLAYLIST_CONTENT_TYPES = {
+    'audio/x-mpegurl': 'm3u',
+    'audio/mpegurl': 'm3u',
+    'audio/x-scpls': 'pls',
+    'application/pls+xml': 'pls',
+}
+
+
+def _playlist_format(url, content_type):
+    playlist_format = PLAYLIST_CONTENT_TYPES.get((content_type or '').split(';')[0].strip().lower())
+    if playlist_format is not None:
+        return playlist_format
+    path = url.split('?', 1)[0].lower()
+    # .m3u8 is HLS, which the device plays itself.
+    if path.endswith('.m3u'):
+        return 'm3u'
+    if path.endswith('.pls'):
+        return 'pls'
+    return None
+
+
+# Returns the first stream URL listed in an M3U or PLS playlist, None if there is none.
+def parse_playlist(text, playlist_format):
+    for line in text.splitlines():
+        line = line.strip()
+        if playlist_format == 'pls':
+            key, _, value = line.partition('=')
+            if not key.lower().startswith('file'):
+                continue
+            line = value.strip()
+        elif line.startswith('#'):
+            continue
+        if line.lower().startswith(('http://', 'https://')):
+            return line
+    return None
+
+
+# Follows redirects and expands M3U/PLS playlists, returning the URL the
+# media is finally served from. Only the headers of the media response are read.
+def resolve_stream_url(url, timeout=STREAM_RESOLVER_TIMEOUT, max_depth=MAX_PLAYLIST_DEPTH):
+    from urllib.request import (Request, urlopen)
+
+    for _ in range(max_depth + 1):
+        response = urlopen(Request(url, headers={'User-Agent': 'AXRRadio-Resolver/1.0'}), timeout=timeout)
+        try:
+            final_url = response.geturl()
+            playlist_format = _playlist_format(final_url, response.headers.get('Content-Type'))
+            if playlist_format is None:
+                return final_url
+            charset = response.headers.get_content_charset() or 'latin-1'
+            entry = parse_playlist(response.read(MAX_PLAYLIST_SIZE).decode(charset, 'replace'), playlist_format)
+        finally:
+            response.close()
+        if entry is None:
+            raise ValueError("Playlist {} doesn't list any stream".format(final_url))
+        url = entry
+    raise ValueError("Playlists nested more than {} levels deep".format(max_depth))
+
+
+# Cache of resolved stream URLs, keyed by catalog URL.
+#
+# get() never blocks: it returns the cached resolution, or the catalog URL
+# while there is none yet, and schedules a resolution on a small background
+# pool when the entry is missing or older than the TTL (a stale resolution
+# keeps being served until the new one is in). Resolutions that don't end on
+# an HTTPS URL, which the AudioPlayer requires, or that fail keep the
+# catalog URL. Disabled, get() returns the catalog URL as is.
+class StreamUrlResolver(object):
+
+    def __init__(self, enabled=STREAM_URL_RESOLUTION, ttl=STREAM_RESOLVER_TTL, resolve=resolve_stream_url,
+                 pool=None, clock=time.time):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.resolve = resolve
+        self.pool = pool or IoPool(max_workers=2)
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._resolved = {}
+        self._in_flight = {}
+
+    def get(self, url):
+        if not self.enabled:
+            return url
+        entry = self._resolved.get(url)
+        if entry is None or self.clock() - entry[1] >= self.ttl:
+            self.refresh(url)
+        return entry[0] if entry is not None else url
+
+    # Schedules a resolution of url, unless one is already running. Returns its future.
+    def refresh(self, url):
+        with self._lock:
+            future = self._in_flight.get(url)
+            if future is None:
+                future = self.pool.submit(self._resolve, url)
+                self._in_flight[url] = future
+            return future
+
+    # Forgets the resolution of url, e.g. after playback of it failed.
+    def invalidate(self, url):
+        with self._lock:
+            self._resolved.pop(url, None)
+
+    def clear(self):
+        with self._lock:
+            self._resolved = {}
+
+    def _resolve(self, url):
+        try:
+            resolved = self.resolve(url)
+            if not resolved.lower().startswith('https://'):
+                logger.warning("Stream %s resolves to non-HTTPS %s, keeping the catalog URL", url, resolved)
+                resolved = url
+        except Exception as e:
+            logger.warning("Unable to resolve stream %s: %s", url, e)
+            resolved = url
+        with self._lock:
+            self._resolved[url] = (resolved, self.clock())
+            self._in_flight.pop(url, None)
+        return resolved
+
+
+stream_resolver = StreamUrlResolver()
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import logging
+import os
+import random
+
+from ask_sdk_core.serialize import DefaultSerializer
+
+# Level of the skill's loggers, e.g. DEBUG to get the request/response dumps.
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+
+# "json" writes every record as a single JSON line, "text" keeps the runtime's format.
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json').lower()
+
+# Per request type sampling of the request/response dumps, e.g.
+# "LaunchRequest=1,AudioPlayer.PlaybackStarted=0.01,*=0.1". The request type
+# of an intent request is the intent name, "*" applies to all other types.
+LOG_SAMPLE_RATES = os.environ.get('LOG_SAMPLE_RATES', '')
+
+REDACTED = '[REDACTED]'
+
+# Keys (compared without case and underscores, so both the JSON and the SDK
+# model spelling match) whose values are dropped, and the ones replaced with
+# a short fingerprint so records of the same device or user can be correlated.
+REDACTED_KEYS = frozenset([
+    'addressline1', 'addressline2', 'addressline3', 'postalcode', 'city', 'districtorcounty', 'stateorregion',
+    'consenttoken', 'apiaccesstoken', 'accesstoken',
+])
+FINGERPRINTED_KEYS = frozenset(['deviceid', 'userid', 'personid'])
+
+
+def _normalize_key(key):
+    return key.replace('_', '').lower() if isinstance(key, str) else key
+
+
+def fingerprint(value):
+    return 'sha256:' + hashlib.sha256(str(value).encode('utf-8')).hexdigest()[:12]
+
+
+# Returns a copy of value (JSON-like dicts and lists) with addresses, tokens
+# and identifiers redacted.
+def redact(value):
+    if isinstance(value, dict):
+        redacted = {}
+        for key, item in value.items():
+            normalized_key = _normalize_key(key)
+            if item is None:
+                redacted[key] = None
+            elif normalized_key in REDACTED_KEYS:
+                redacted[key] = REDACTED
+            elif normalized_key in FINGERPRINTED_KEYS:
+                redacted[key] = fingerprint(item)
+            else:
+                redacted[key] = redact(item)
+        return redacted
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    return value
+
+
+_serializer = DefaultSerializer()
+
+
+# Turns an SDK model object into the JSON-ready dict Alexa sent or receives.
+def serialize(model):
+    return _serializer.serialize(model)
+
+
+# Formats a record as one compact JSON line.
+#
+# Structured data is passed as extra={'fields': ...}, either a dict or a
+# callable returning one. The callable is only invoked here, i.e. once the
+# logger has decided the record is emitted, so building the fields costs
+# nothing for records that are dropped. Fields are always redacted.
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+        entry = {
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        request_id = getattr(record, 'aws_request_id', None)
+        if request_id is not None:
+            entry['requestId'] = request_id
+        fields = _fields_of(record)
+        if fields:
+            entry.update(redact(fields))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, separators=(',', ':'), default=str)
+
+
+def _fields_of(record):
+    fields = getattr(record, 'fields', None)
+    if callable(fields):
+        fields = fields()
+    return fields
+
+
+# In text mode, appends the fields of a record to its message as compact
+# JSON, so e.g. the request/response dumps aren't bare "Alexa Request" lines.
+# Filters of a logger only run for records that passed its level, the fields
+# are still built only for records that are emitted. Fields are redacted.
+class TextFieldsFilter(logging.Filter):
+
+    def filter(self, record):
+        fields = _fields_of(record)
+        if fields:
+            record.msg = '{} {}'.format(
+                record.getMessage(), json.dumps(redact(fields), separators=(',', ':'), default=str))
+            record.args = None
+            record.fields = None
+        return True
+
+
+def _parse_sample_rates(sample_rates):
+    rates = {}
+    for item in filter(None, (part.strip() for part in sample_rates.split(','))):
+        request_type, _, rate = item.rpartition('=')
+        rates[request_type.strip() or '*'] = min(max(float(rate), 0.0), 1.0)
+    return rates
+
+
+# Decides, per request type, whether the request/response of an invocation are logged.
+class LogSampler(object):
+
+    def __init__(self, sample_rates=LOG_SAMPLE_RATES):
+        self.rates = _parse_sample_rates(sample_rates)
+        self.default_rate = self.rates.pop('*', 1.0)
+
+    def rate(self, request_type):
+        return self.rates.get(request_type, self.default_rate)
+
+    def sampled(self, request_type):
+        rate = self.rate(request_type)
+        return rate >= 1.0 or (rate > 0.0 and random.random() < rate)
+
+
+log_sampler = LogSampler()
+
+
+# Sets the level of the given logger and, in json mode, puts the JsonFormatter
+# on the root handlers (the one the Lambda runtime installs). In text mode the
+# runtime's format is kept and the logger gets the TextFieldsFilter.
+def configure_logging(logger, level=LOG_LEVEL, log_format=LOG_FORMAT):
+    logger.setLevel(level)
+    if log_format == 'json':
+        for handler in logging.getLogger().handlers:
+            if not isinstance(handler.formatter, JsonFormatter):
+                handler.setFormatter(JsonFormatter())
+    elif not any(isinstance(log_filter, TextFieldsFilter) for log_filter in logger.filters):
+        logger.addFilter(TextFieldsFilter())
+    return logger
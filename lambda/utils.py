@@ -1,33 +1,131 @@
-import requests
 import logging
 import os
-import boto3
-import json
-import random
+import threading
+import time
 
-from botocore.exceptions import ClientError
+from collections import OrderedDict
 
+from clients import (client_registry, S3)
+from stream_catalog import stream_catalog
 
+# Lifetime of a presigned URL, and how long before it expires a cached URL is
+# replaced, so a device that starts fetching an asset just before the end
+# still gets a valid URL.
+PRESIGNED_URL_EXPIRES_IN = int(os.environ.get('PRESIGNED_URL_EXPIRES_IN_SECONDS', '6000'))
+PRESIGNED_URL_SAFETY_MARGIN = int(os.environ.get('PRESIGNED_URL_SAFETY_MARGIN_SECONDS', '600'))
 
+# Number of (bucket, object) URLs kept by a warm container.
+PRESIGNED_URL_CACHE_SIZE = int(os.environ.get('PRESIGNED_URL_CACHE_SIZE', '256'))
+
+
+# boto3 is imported on first use, it is one of the most expensive imports of the
+# skill and most invocations never sign a URL. The S3 client is created once per
+# container by the client registry (see clients.py).
+def sign_s3_url(bucket_name, object_name, expires_in=PRESIGNED_URL_EXPIRES_IN):
+    s3_client = client_registry.get(S3)
+    return s3_client.generate_presigned_url('get_object',
+                                            Params={'Bucket': bucket_name,
+                                                    'Key': object_name},
+                                            ExpiresIn=expires_in)
+
+
+# In-process LRU of (bucket, object) -> presigned URL.
+#
+# A URL is handed out again until safety_margin seconds before it expires,
+# then signed anew on the next lookup. Signing is local (no S3 call), but it
+# costs a client lookup, credential resolution and an HMAC chain per URL,
+# which every directive carrying album art or a background image paid for.
+# Failed signatures aren't cached.
+class PresignedUrlCache(object):
+
+    def __init__(self, max_size=PRESIGNED_URL_CACHE_SIZE, expires_in=PRESIGNED_URL_EXPIRES_IN,
+                 safety_margin=PRESIGNED_URL_SAFETY_MARGIN, sign=sign_s3_url, clock=time.time):
+        self.max_size = max_size
+        self.expires_in = expires_in
+        self.safety_margin = min(safety_margin, expires_in)
+        self.sign = sign
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, bucket_name, object_name):
+        return self.get_many(bucket_name, [object_name]).get(object_name)
+
+    # Presigned URLs of several objects of a bucket, object name -> URL.
+    # Objects that couldn't be signed are left out.
+    def get_many(self, bucket_name, object_names):
+        from botocore.exceptions import ClientError
+
+        now = self.clock()
+        urls = {}
+        missing = []
+        with self._lock:
+            for object_name in object_names:
+                entry = self._entries.get((bucket_name, object_name))
+                if entry is not None and now < entry[1]:
+                    self._entries.move_to_end((bucket_name, object_name))
+                    urls[object_name] = entry[0]
+                else:
+                    missing.append(object_name)
+
+        signed = []
+        for object_name in missing:
+            try:
+                urls[object_name] = self.sign(bucket_name, object_name, expires_in=self.expires_in)
+                signed.append(object_name)
+            except ClientError as e:
+                logging.error(e)
+
+        if signed:
+            refresh_at = now + self.expires_in - self.safety_margin
+            with self._lock:
+                for object_name in signed:
+                    self._entries[(bucket_name, object_name)] = (urls[object_name], refresh_at)
+                    self._entries.move_to_end((bucket_name, object_name))
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return urls
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    # Filled by lookups, there is nothing to preload.
+    def preload(self):
+        pass
+
+    # Stale entries are the ones past their refresh time, signed again on their next lookup.
+    def cache_state(self):
+        now = self.clock()
+        with self._lock:
+            refresh_ats = [refresh_at for _, refresh_at in self._entries.values()]
+        stale = sum(1 for refresh_at in refresh_ats if now >= refresh_at)
+        return {
+            'loaded': bool(refresh_ats),
+            'entries': len(refresh_ats),
+            'age_seconds': None,
+            'stale': stale > 0,
+            'stale_entries': stale,
+        }
+
+
+presigned_url_cache = PresignedUrlCache()
+
+
+# Returns a presigned URL for an object of the S3_PERSISTENCE_BUCKET, None if it can't be signed.
 def create_presigned_url(object_name):
-    s3_client = boto3.client('s3',
-                             region_name=os.environ.get('S3_PERSISTENCE_REGION'),
-                             config=boto3.session.Config(signature_version='s3v4',s3={'addressing_style': 'path'}))
-    try:
-        bucket_name = os.environ.get('S3_PERSISTENCE_BUCKET')
-        response = s3_client.generate_presigned_url('get_object',
-                                                    Params={'Bucket': bucket_name,
-                                                            'Key': object_name},
-                                                    ExpiresIn=6000)
-    except ClientError as e:
-        logging.error(e)
-        return None
-
-    # The response contains the presigned URL
-    return response
+    return presigned_url_cache.get(os.environ.get('S3_PERSISTENCE_BUCKET'), object_name)
+
+
+# Presigned URLs of several objects of the S3_PERSISTENCE_BUCKET at once, object name -> URL.
+def create_presigned_urls(object_names):
+    return presigned_url_cache.get_many(os.environ.get('S3_PERSISTENCE_BUCKET'), object_names)
 
+# Returns the read-only catalog record for the given country code, or None when
+# the catalog has no entry for it. The catalog is parsed once per container,
+# see stream_catalog.StreamCatalog.
 def get_stream_data(country_code):
-    stream_db_json = open ('stream_db.json', "r")
-    stream_db = json.loads(stream_db_json.read())
-    stream_data = stream_db.get(country_code)
-    return stream_data
\ No newline at end of file
+    return stream_catalog.get(country_code)
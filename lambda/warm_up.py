@@ -0,0 +1,70 @@
+import logging
+import time
+
+from metrics import put_metric
+from structured_logging import configure_logging
+
+logger = configure_logging(logging.getLogger(__name__))
+
+
+# Scheduled keep-warm invocations: an EventBridge (CloudWatch Events) schedule
+# rule sends {"source": "aws.events", "detail-type": "Scheduled Event", ...},
+# most keep-warm tools send {"warmup": true}. Alexa requests always have a "request".
+def is_warm_up_event(event):
+    if not isinstance(event, dict) or 'request' in event:
+        return False
+    return event.get('source') == 'aws.events' or event.get('warmup') is True
+
+
+# Preloads the process-wide caches and clients and reports their state.
+#
+# caches is an ordered list of (name, cache) pairs; every cache has a
+# preload() method, which loads or refreshes whatever it can ahead of
+# requests, and a cache_state() method, returning a dict with at least
+# 'loaded', 'entries', 'age_seconds' and 'stale'. A cache that fails to
+# preload is reported with its error, the others are preloaded anyway. A dict
+# returned by preload() (e.g. which clients connected) is reported as well.
+class ContainerWarmer(object):
+
+    def __init__(self, caches):
+        self.caches = caches
+
+    def warm_up(self):
+        started = time.time()
+        caches = {}
+        for name, cache in self.caches:
+            state_before = cache.cache_state()
+            cache_started = time.time()
+            error = None
+            preloaded = None
+            try:
+                preloaded = cache.preload()
+            except Exception as e:
+                logger.warning("Unable to preload %s: %s", name, e)
+                error = str(e)
+            state = dict(cache.cache_state(), was_loaded=state_before['loaded'], was_stale=state_before['stale'],
+                         preload_ms=(time.time() - cache_started) * 1000)
+            if isinstance(preloaded, dict):
+                state['preloaded'] = preloaded
+            if error is not None:
+                state['error'] = error
+            caches[name] = state
+        duration_ms = (time.time() - started) * 1000
+        put_metric('WarmUpTime', duration_ms, unit='Milliseconds')
+        result = {'warm_up': True, 'duration_ms': duration_ms, 'caches': caches}
+        logger.info("Warm-up", extra={'fields': result})
+        return result
+
+
+# Lambda entry point that answers warm-up events with ContainerWarmer.warm_up,
+# without entering the SDK, and passes everything else on to handler.
+class WarmUpFastPath(object):
+
+    def __init__(self, warmer, handler):
+        self.warmer = warmer
+        self.handler = handler
+
+    def __call__(self, event, context):
+        if is_warm_up_event(event):
+            return self.warmer.warm_up()
+        return self.handler(event, context)
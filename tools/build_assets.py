@@ -0,0 +1,327 @@
+"""
+Validates the skill's static assets and compiles them into lambda/compiled_assets.json.
+
+Checked:
+- lambda/stream_db.json: required fields of every entry, HTTPS URLs and
+  mirrors, station metadata, and station names or aliases shared by two stations
+- lambda/languages/*.json: every prompt key the code reads is defined for each
+  locale once its fallback chain is resolved, prompts are strings or non-empty
+  lists of strings, and the number of {} placeholders matches the number of
+  arguments the code passes to .format() (no placeholders otherwise)
+- interactionModels/custom/*.json: structure, intent and slot references,
+  STATION_NAME ids that aren't catalog keys, intents the code handles vs.
+  intents the model declares and stations missing from STATION_NAME (warnings)
+
+The bundle holds the catalog and the language files in a single JSON file,
+which the Lambda function loads at import instead of parsing each source
+file. It is committed along with the sources, as the deployment package is
+built from the repository without a build step. Run this after changing any
+asset; --check fails when the bundle is out of date, e.g. in CI.
+
+Usage:
+    python tools/build_assets.py [--check]
+"""
+
+import argparse
+import ast
+import glob
+import hashlib
+import json
+import os
+import re
+import string
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAMBDA_DIR = os.path.join(ROOT_DIR, 'lambda')
+INTERACTION_MODELS_DIR = os.path.join(ROOT_DIR, 'interactionModels', 'custom')
+HANDLERS_SOURCE = os.path.join(LAMBDA_DIR, 'lambda_function.py')
+
+sys.path.insert(0, LAMBDA_DIR)
+
+from asset_bundle import (ASSET_BUNDLE_PATH, ASSET_BUNDLE_FORMAT)
+from localization import (LANGUAGES_DIR, DEFAULT_LOCALE, fallback_chain)
+from stream_catalog import (STREAM_DB_PATH, DEFAULT_STREAM_KEY, MIRRORS_FIELD)
+from station_index import (normalize_name, station_names, STATION_NAME_FIELD, ALIASES_FIELD, REGION_FIELD,
+                           COUNTRY_CODE_FIELD)
+
+REQUIRED_STREAM_FIELDS = ('stream_url', 'stream_title', 'stream_subtitle', 'album_art', 'background_image')
+URL_FIELDS = ('stream_url', 'album_art', 'background_image')
+# Country streams are named in the prompts, the default stream isn't.
+COUNTRY_STREAM_FIELDS = ('country_name',)
+COUNTRY_CODE_PATTERN = re.compile(r'^[A-Z]{2}$')
+
+# Slot type whose value ids are catalog keys, see station_index.StationDirectory.resolve_slot.
+STATION_SLOT_TYPE = 'STATION_NAME'
+
+
+class Report(object):
+
+    def __init__(self):
+        self.errors = []
+        self.warnings = []
+
+    def error(self, source, message):
+        self.errors.append('{}: {}'.format(os.path.relpath(source, ROOT_DIR), message))
+
+    def warning(self, source, message):
+        self.warnings.append('{}: {}'.format(os.path.relpath(source, ROOT_DIR), message))
+
+
+def _read_json(path, report):
+    try:
+        with open(path, 'rb') as json_file:
+            raw = json_file.read()
+        return raw, json.loads(raw.decode('utf-8'))
+    except (IOError, ValueError) as e:
+        report.error(path, 'unreadable JSON: {}'.format(e))
+        return None, None
+
+
+# What the code expects from the assets, read from the handlers' source:
+# the prompt keys it reads, the number of .format() arguments per prompt key
+# and the intents the handlers declare.
+def analyze_handlers(source_path=HANDLERS_SOURCE):
+    with open(source_path) as source_file:
+        tree = ast.parse(source_file.read(), source_path)
+
+    def prompt_key(node):
+        if (isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name)
+                and node.value.id == 'language_prompts'):
+            # Python < 3.9 wraps the subscript in an ast.Index.
+            index = node.slice.value if isinstance(node.slice, getattr(ast, 'Index', ())) else node.slice
+            try:
+                return ast.literal_eval(index)
+            except ValueError:
+                return None
+        return None
+
+    prompt_keys = set()
+    format_arguments = {}
+    intent_names = set()
+    for node in ast.walk(tree):
+        key = prompt_key(node)
+        if key is not None:
+            prompt_keys.add(key)
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == 'format':
+            for inner in ast.walk(node.func.value):
+                key = prompt_key(inner)
+                if key is not None:
+                    format_arguments[key] = len(node.args)
+        if isinstance(node, ast.ClassDef):
+            for statement in node.body:
+                if (isinstance(statement, ast.Assign) and len(statement.targets) == 1
+                        and getattr(statement.targets[0], 'id', None) == 'intent_names'):
+                    intent_names.update(ast.literal_eval(statement.value))
+    return prompt_keys, format_arguments, intent_names
+
+
+def validate_catalog(path, report):
+    raw, stream_db = _read_json(path, report)
+    if stream_db is None:
+        return None, None
+    if not isinstance(stream_db, dict):
+        report.error(path, 'expected an object of catalog entries')
+        return None, None
+    if DEFAULT_STREAM_KEY not in stream_db:
+        report.error(path, 'no "{}" entry'.format(DEFAULT_STREAM_KEY))
+    for key, entry in sorted(stream_db.items()):
+        if not isinstance(entry, dict):
+            report.error(path, '{}: expected an object'.format(key))
+            continue
+        required = REQUIRED_STREAM_FIELDS + (COUNTRY_STREAM_FIELDS if key != DEFAULT_STREAM_KEY else ())
+        for field in required:
+            if not isinstance(entry.get(field), str) or not entry[field].strip():
+                report.error(path, '{}: missing or empty "{}"'.format(key, field))
+        for field in URL_FIELDS:
+            if isinstance(entry.get(field), str) and not entry[field].startswith('https://'):
+                report.error(path, '{}: "{}" must be an HTTPS URL'.format(key, field))
+        mirrors = entry.get(MIRRORS_FIELD, [])
+        if not isinstance(mirrors, list) or not all(
+                isinstance(url, str) and url.startswith('https://') for url in mirrors):
+            report.error(path, '{}: "{}" must be a list of HTTPS URLs'.format(key, MIRRORS_FIELD))
+        validate_station(path, key, entry, report)
+
+    names = {}
+    for key, entry in sorted(stream_db.items()):
+        if not isinstance(entry, dict) or not isinstance(entry.get('stream_subtitle'), str):
+            continue
+        for name in set(normalize_name(name) for name in station_names(entry) if isinstance(name, str)):
+            if name in names and names[name] != key:
+                report.error(path, '{}: "{}" is also a name of {}'.format(key, name, names[name]))
+            names.setdefault(name, key)
+    return raw, stream_db
+
+
+def validate_station(path, key, entry, report):
+    for field in (STATION_NAME_FIELD, REGION_FIELD):
+        if field in entry and (not isinstance(entry[field], str) or not normalize_name(entry[field])):
+            report.error(path, '{}: "{}" must be a non-empty string'.format(key, field))
+    if COUNTRY_CODE_FIELD in entry and not COUNTRY_CODE_PATTERN.match(str(entry[COUNTRY_CODE_FIELD])):
+        report.error(path, '{}: "{}" must be a two letter upper case code'.format(key, COUNTRY_CODE_FIELD))
+    aliases = entry.get(ALIASES_FIELD, [])
+    if not isinstance(aliases, list) or not all(isinstance(alias, str) and normalize_name(alias) for alias in aliases):
+        report.error(path, '{}: "{}" must be a list of non-empty names'.format(key, ALIASES_FIELD))
+
+
+def _placeholder_count(text):
+    return sum(1 for _, field_name, _, _ in string.Formatter().parse(text) if field_name is not None)
+
+
+def validate_languages(languages_dir, prompt_keys, format_arguments, report):
+    language_files = {}
+    sources = {}
+    for path in sorted(glob.glob(os.path.join(languages_dir, '*.json'))):
+        raw, prompts = _read_json(path, report)
+        if prompts is None:
+            continue
+        if not isinstance(prompts, dict):
+            report.error(path, 'expected an object of prompts')
+            continue
+        locale = os.path.splitext(os.path.basename(path))[0]
+        language_files[locale] = prompts
+        sources[locale] = {'size': len(raw), 'sha1': hashlib.sha1(raw).hexdigest()}
+        for key, value in sorted(prompts.items()):
+            variants = value if isinstance(value, list) else [value]
+            if not variants or not all(isinstance(variant, str) and variant.strip() for variant in variants):
+                report.error(path, '{}: expected a non-empty string or list of strings'.format(key))
+                continue
+            expected = format_arguments.get(key, 0)
+            for variant in variants:
+                try:
+                    count = _placeholder_count(variant)
+                except ValueError as e:
+                    report.error(path, '{}: malformed placeholder in "{}": {}'.format(key, variant, e))
+                    continue
+                if count != expected:
+                    report.error(path, '{}: "{}" has {} placeholders, the code passes {}'.format(
+                        key, variant, count, expected))
+
+    if DEFAULT_LOCALE not in language_files:
+        report.error(languages_dir, 'no file for the default locale {}'.format(DEFAULT_LOCALE))
+    for locale in sorted(language_files):
+        resolved = set()
+        for fallback_locale in fallback_chain(locale, DEFAULT_LOCALE):
+            resolved.update(language_files.get(fallback_locale, {}))
+        for key in sorted(prompt_keys - resolved):
+            report.error(os.path.join(languages_dir, locale + '.json'), 'no "{}" prompt, even after fallback'.format(key))
+
+    return sources, language_files
+
+
+def validate_interaction_model(path, handled_intents, stream_db, report):
+    _, model = _read_json(path, report)
+    if model is None:
+        return
+    language_model = (model.get('interactionModel') or {}).get('languageModel')
+    if not isinstance(language_model, dict):
+        report.error(path, 'no interactionModel.languageModel')
+        return
+    invocation_name = language_model.get('invocationName')
+    if not isinstance(invocation_name, str) or not invocation_name.strip() or invocation_name != invocation_name.lower():
+        report.error(path, 'invocationName must be a non-empty lower case string')
+
+    slot_types = set(slot_type.get('name') for slot_type in language_model.get('types') or [])
+    for slot_type in language_model.get('types') or []:
+        if slot_type.get('name') == STATION_SLOT_TYPE and stream_db is not None:
+            ids = set(value.get('id') for value in slot_type.get('values') or [])
+            for value_id in sorted(ids - set(stream_db), key=str):
+                report.error(path, '{} value id {} is not a catalog key'.format(STATION_SLOT_TYPE, value_id))
+            for key in sorted(set(stream_db) - ids):
+                report.warning(path, 'station {} has no {} value, it is only found by the index'.format(
+                    key, STATION_SLOT_TYPE))
+    intents = set()
+    for intent in language_model.get('intents') or []:
+        name = intent.get('name')
+        if not name:
+            report.error(path, 'intent without a name')
+            continue
+        if name in intents:
+            report.error(path, 'intent {} declared twice'.format(name))
+        intents.add(name)
+        slots = set()
+        for slot in intent.get('slots') or []:
+            slots.add(slot.get('name'))
+            slot_type = slot.get('type') or ''
+            if not slot_type.startswith('AMAZON.') and slot_type not in slot_types:
+                report.error(path, '{}: slot {} has undeclared type {}'.format(name, slot.get('name'), slot_type))
+        samples = intent.get('samples') or []
+        if not name.startswith('AMAZON.') and not samples:
+            report.error(path, '{}: custom intent without samples'.format(name))
+        for sample in samples:
+            if not isinstance(sample, str):
+                report.error(path, '{}: sample {!r} is not a string'.format(name, sample))
+                continue
+            try:
+                referenced = set(field_name for _, field_name, _, _ in string.Formatter().parse(sample) if field_name)
+            except ValueError as e:
+                report.error(path, '{}: malformed sample "{}": {}'.format(name, sample, e))
+                continue
+            for slot in sorted(referenced - slots):
+                report.error(path, '{}: sample "{}" references undeclared slot {}'.format(name, sample, slot))
+
+    for intent in sorted(intents - handled_intents):
+        report.warning(path, 'intent {} has no handler, it ends up in the exception handler'.format(intent))
+    for intent in sorted(handled_intents - intents):
+        if not intent.startswith('AMAZON.'):
+            report.warning(path, 'intent {} is handled but not in the model, users can\'t reach it'.format(intent))
+
+
+def build(report):
+    prompt_keys, format_arguments, handled_intents = analyze_handlers()
+    raw_stream_db, stream_db = validate_catalog(STREAM_DB_PATH, report)
+    language_sources, language_files = validate_languages(LANGUAGES_DIR, prompt_keys, format_arguments, report)
+    for path in sorted(glob.glob(os.path.join(INTERACTION_MODELS_DIR, '*.json'))):
+        validate_interaction_model(path, handled_intents, stream_db, report)
+    if report.errors:
+        return None
+    return {
+        'format': ASSET_BUNDLE_FORMAT,
+        'stream_db_sha1': hashlib.sha1(raw_stream_db).hexdigest(),
+        'stream_db': stream_db,
+        'language_sources': language_sources,
+        'language_files': language_files,
+    }
+
+
+def serialize(bundle):
+    return json.dumps(bundle, sort_keys=True, separators=(',', ':'), ensure_ascii=False) + '\n'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--check', action='store_true', help='only validate and check the bundle is up to date')
+    parser.add_argument('--output', default=ASSET_BUNDLE_PATH)
+    args = parser.parse_args(argv)
+
+    report = Report()
+    bundle = build(report)
+    for warning in report.warnings:
+        print('warning: ' + warning)
+    for error in report.errors:
+        print('error: ' + error)
+    if bundle is None:
+        print('{} error(s), {} not written'.format(len(report.errors), os.path.relpath(args.output, ROOT_DIR)))
+        return 1
+
+    content = serialize(bundle)
+    if args.check:
+        try:
+            with open(args.output, encoding='utf-8') as bundle_file:
+                current = bundle_file.read()
+        except IOError:
+            current = None
+        if current != content:
+            print('{} is out of date, run python tools/build_assets.py'.format(os.path.relpath(args.output, ROOT_DIR)))
+            return 1
+        print('Assets valid, {} up to date'.format(os.path.relpath(args.output, ROOT_DIR)))
+        return 0
+
+    with open(args.output, 'w', encoding='utf-8') as bundle_file:
+        bundle_file.write(content)
+    print('Assets valid, wrote {}'.format(os.path.relpath(args.output, ROOT_DIR)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())